@@ -0,0 +1,338 @@
+"""Benchmark representative API flows and check them against stored budgets.
+
+Start the database as for development (``docker compose up -d petrodb``) and
+run ``uv run --group bench python bench/bench.py``. The ``asgi`` mode drives
+the application in-process through its ASGI interface, the ``uvicorn`` mode
+spawns a real server and goes through HTTP. Reads bypass the response cache
+and go to the primary, so the budgets measure the database path; pass
+``--cache`` to measure cached reads instead.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+_ = load_dotenv()
+BUDGETS = Path(__file__).with_name("budgets.json")
+OXIDES = ("SiO2", "TiO2", "Al2O3", "FeO", "MnO", "MgO", "CaO", "Na2O", "K2O")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def random_values(rng: random.Random) -> dict[str, float]:
+    return {oxide: round(rng.uniform(0, 60), 3) for oxide in OXIDES}
+
+
+@asynccontextmanager
+async def asgi_client():
+    from petroapi import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(workers: int):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "petroapi:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ]
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/openapi.json")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+            yield client
+    finally:
+        server.terminate()
+        server.wait()
+
+
+class Bench:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.results: dict[str, dict[str, float]] = {}
+        # set once setup created the project
+        self.pid = None
+
+    async def login(self) -> str:
+        response = await self.client.post(
+            "/token",
+            data={
+                "username": "admin",
+                "password": os.environ.get("ADMIN_PASSWORD"),
+            },
+        )
+        response.raise_for_status()
+        self.refresh_token = response.json()["refresh_token"]
+        return response.json()["access_token"]
+
+    async def refresh(self):
+        response = await self.client.post(
+            "/token/refresh", json={"refresh_token": self.refresh_token}
+        )
+        response.raise_for_status()
+        self.headers = self.auth_headers(response.json()["access_token"])
+
+    def auth_headers(self, token: str) -> dict[str, str]:
+        headers = {"Authorization": f"Bearer {token}"}
+        if not self.args.cache:
+            # skips the response cache, GETs would mostly be cache hits
+            headers["X-Read-Your-Writes"] = "true"
+        return headers
+
+    async def call(self, method: str, url: str, **kwargs) -> httpx.Response:
+        response = await self.client.request(
+            method, url, headers=self.headers, **kwargs
+        )
+        response.raise_for_status()
+        return response
+
+    async def setup(self):
+        self.headers = self.auth_headers(await self.login())
+        name = f"bench-{self.args.seed}-{int(time.time())}"
+        project = await self.call("POST", "/api/project/", json={"name": name})
+        self.pid = project.json()["id"]
+        # membership changed, refreshed so the projects come from the token
+        await self.refresh()
+        for i in range(self.args.samples):
+            sample = await self.call(
+                "POST", f"/api/sample/{self.pid}", json={"name": f"S{i}"}
+            )
+            self.sid = sample.json()["id"]
+        spots = [
+            {
+                "label": f"init-{i}",
+                "mineral": self.rng.choice(["Grt", "Pl", "Bt"]),
+                "values": random_values(self.rng),
+            }
+            for i in range(self.args.spots)
+        ]
+        await self.call("POST", f"/api/spots/{self.pid}/{self.sid}", json=spots)
+        profile = await self.call(
+            "POST",
+            f"/api/profile/{self.pid}/{self.sid}",
+            json={"label": "bench", "mineral": "Grt"},
+        )
+        self.prid = profile.json()["id"]
+        points = [
+            {"index": i, "values": random_values(self.rng)}
+            for i in range(self.args.profile_points)
+        ]
+        await self.call(
+            "POST", f"/api/profilespots/{self.pid}/{self.sid}/{self.prid}", json=points
+        )
+
+    async def teardown(self):
+        if self.pid is None:
+            return
+        # hard delete of the whole bench project, cascaded by the database
+        start = time.perf_counter()
+        await self.call("DELETE", f"/api/project/{self.pid}")
+        elapsed = (time.perf_counter() - start) * 1000
+        self.results["project_delete"] = {
+            "requests": 1,
+            "throughput": 1000 / elapsed,
+            "mean_ms": elapsed,
+            "p50_ms": elapsed,
+            "p95_ms": elapsed,
+            "p99_ms": elapsed,
+        }
+
+    def flows(self):
+        upload_counter = iter(range(sys.maxsize))
+
+        async def upload():
+            n = next(upload_counter)
+            spots = [
+                {
+                    "label": f"up-{n}-{i}",
+                    "mineral": "Pl",
+                    "values": random_values(self.rng),
+                }
+                for i in range(self.args.upload_size)
+            ]
+            await self.call("POST", f"/api/spots/{self.pid}/{self.sid}", json=spots)
+
+        return {
+            "login": self.login,
+            "sample_list": lambda: self.call("GET", f"/api/samples/{self.pid}"),
+            "spot_bulk_upload": upload,
+            "profilespot_read": lambda: self.call(
+                "GET", f"/api/profilespots/{self.pid}/{self.sid}/{self.prid}"
+            ),
+            "search": lambda: self.call(
+                "GET", f"/api/search/spots/{self.pid}/{self.sid}/Grt"
+            ),
+        }
+
+    async def run_flow(self, name: str, flow, requests: int):
+        latencies = []
+        queue = iter(range(requests))
+
+        async def worker():
+            for _ in queue:
+                start = time.perf_counter()
+                await flow()
+                latencies.append(time.perf_counter() - start)
+
+        for _ in range(self.args.warmup):
+            await flow()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - start
+        self.results[name] = {
+            "requests": requests,
+            "throughput": requests / elapsed,
+            "mean_ms": statistics.fmean(latencies) * 1000,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+
+    async def run(self):
+        await self.setup()
+        try:
+            for name, flow in self.flows().items():
+                if self.args.flow and name not in self.args.flow:
+                    continue
+                requests = self.args.requests
+                if name in ("login", "spot_bulk_upload"):
+                    requests = max(1, requests // 10)
+                await self.run_flow(name, flow, requests)
+        finally:
+            await self.teardown()
+
+
+def check_budgets(results, budgets, tolerance: float) -> list[str]:
+    failures = []
+    for name, result in results.items():
+        budget = budgets.get(name)
+        if budget is None:
+            continue
+        for metric, limit in budget.items():
+            if metric == "throughput":
+                if result[metric] < limit / (1 + tolerance):
+                    failures.append(
+                        f"{name}: {metric} {result[metric]:.1f} < budget {limit}"
+                    )
+            elif result[metric] > limit * (1 + tolerance):
+                failures.append(
+                    f"{name}: {metric} {result[metric]:.1f} > budget {limit}"
+                )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--spots", type=int, default=2000)
+    parser.add_argument("--profile-points", type=int, default=1000)
+    parser.add_argument("--upload-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--flow", action="append", help="run only selected flows")
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="serve reads from the response cache, budgets do not apply",
+    )
+    parser.add_argument("--budgets", type=Path, default=BUDGETS)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--update-budgets",
+        action="store_true",
+        help="store measured p95 latencies as new budgets",
+    )
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+
+    async def run():
+        if args.mode == "asgi":
+            context = asgi_client()
+        else:
+            context = uvicorn_client(args.workers)
+        async with context as client:
+            bench = Bench(client, args)
+            await bench.run()
+            return bench.results
+
+    results = asyncio.run(run())
+    print(
+        f"{'flow':<20}{'req':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:<20}{r['requests']:>6}{r['throughput']:>10.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.cache:
+        # cached reads are not comparable with the budgets
+        return
+    budgets = json.loads(args.budgets.read_text()) if args.budgets.exists() else {}
+    if args.update_budgets:
+        for name, r in results.items():
+            if r["requests"] < 2:
+                # a single run, e.g. project_delete, is no percentile
+                continue
+            budget = budgets.setdefault(args.mode, {}).setdefault(name, {})
+            budget["p95_ms"] = round(r["p95_ms"], 1)
+        args.budgets.write_text(json.dumps(budgets, indent=2) + "\n")
+        return
+    failures = check_budgets(results, budgets.get(args.mode, {}), args.tolerance)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+#!/bin/bash
+# allow streaming replication for the optional read replica
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -1,8 +1,21 @@
+from contextlib import asynccontextmanager
 from os.path import dirname, join
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
-from petroapi.database import Base, engine
+from petroapi.database import engine
+from petroapi.cache import CacheMiddleware, broker, response_cache
+from petroapi.cache import router as cache_router
 from petroapi.config import init_db
+from petroapi.events import hub as event_hub
+from petroapi.idempotency import IdempotencyMiddleware
+from petroapi.idempotency import shutdown as shutdown_idempotency
+from petroapi.idempotency import start as start_idempotency
+from petroapi.jobs import resume_interrupted, shutdown as shutdown_jobs
+from petroapi.metrics import MetricsMiddleware
+from petroapi.metrics import router as metrics_router
+from petroapi.profiler import ProfilerMiddleware
+from petroapi.purge import resume_purges, shutdown as shutdown_purges
 from petroapi.routers.token import router as token_router
 from petroapi.routers.users import router as users_router
 from petroapi.routers.projects import router as projects_router
@@ -12,17 +25,28 @@ from petroapi.routers.areas import router as areas_router
 from petroapi.routers.profiles import router as profiles_router
 from petroapi.routers.profilespots import router as profilespots_router
 from petroapi.routers.search import router as search_router
+from petroapi.routers.batch import router as batch_router
+from petroapi.routers.endmembers import router as endmembers_router
+from petroapi.routers.statistics import router as statistics_router
+from petroapi.routers.snapshots import router as snapshots_router
+from petroapi.routers.changes import router as changes_router
+from petroapi.routers.events import router as events_router
+from petroapi.routers.apikeys import router as apikeys_router
+from petroapi.routers.jobs import router as jobs_router
+from petroapi.routers.uploads import router as uploads_router
+from petroapi.routers.purges import router as purges_router
 
 templates = Jinja2Templates(directory=join(dirname(__file__), "templates"))
 
-Base.metadata.create_all(engine)
-init_db()
-
 tags_metadata = [
     {
         "name": "Users",
         "description": "Manage users - only admin",
     },
+    {
+        "name": "API keys",
+        "description": "Manage API keys for machine clients",
+    },
     {
         "name": "Projects",
         "description": "Manage projects",
@@ -51,19 +75,74 @@ tags_metadata = [
         "name": "Search",
         "description": "Search interface",
     },
+    {
+        "name": "Batch",
+        "description": "Several operations in one transaction",
+    },
+    {
+        "name": "End-members",
+        "description": "Mineral end-member fractions",
+    },
+    {
+        "name": "Statistics",
+        "description": "Project-wide compositional statistics",
+    },
+    {
+        "name": "Sync",
+        "description": "Incremental change feed and change events",
+    },
+    {
+        "name": "Jobs",
+        "description": "Background imports",
+    },
 ]
 
-app = FastAPI(openapi_tags=tags_metadata)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schema sync and admin bootstrap run once per worker start, not on import
+    await run_in_threadpool(init_db)
+    broker.start(response_cache.invalidate)
+    event_hub.start()
+    start_idempotency()
+    await run_in_threadpool(resume_interrupted)
+    await run_in_threadpool(resume_purges)
+    yield
+    await run_in_threadpool(shutdown_jobs)
+    await run_in_threadpool(shutdown_purges)
+    shutdown_idempotency()
+    broker.stop()
+    event_hub.stop()
+    engine.dispose()
+
+
+app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
+app.add_middleware(CacheMiddleware)
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(metrics_router)
+app.include_router(cache_router)
 app.include_router(token_router)
 app.include_router(users_router, prefix="/api", tags=["Users"])
+app.include_router(apikeys_router, prefix="/api", tags=["API keys"])
 app.include_router(projects_router, prefix="/api", tags=["Projects"])
 app.include_router(samples_router, prefix="/api", tags=["Samples"])
 app.include_router(spots_router, prefix="/api", tags=["Spots"])
+app.include_router(uploads_router, prefix="/api", tags=["Spots"])
 app.include_router(areas_router, prefix="/api", tags=["Areas"])
 app.include_router(profiles_router, prefix="/api", tags=["Profiles"])
 app.include_router(profilespots_router, prefix="/api", tags=["Profile spots"])
 app.include_router(search_router, prefix="/api", tags=["Search"])
+app.include_router(batch_router, prefix="/api", tags=["Batch"])
+app.include_router(endmembers_router, prefix="/api", tags=["End-members"])
+app.include_router(statistics_router, prefix="/api", tags=["Statistics"])
+app.include_router(snapshots_router, prefix="/api", tags=["Projects"])
+app.include_router(changes_router, prefix="/api", tags=["Sync"])
+app.include_router(events_router, prefix="/api", tags=["Sync"])
+app.include_router(jobs_router, prefix="/api", tags=["Jobs"])
+app.include_router(purges_router, prefix="/api", tags=["Jobs"])
 
 
 @app.get("/", include_in_schema=False)
@@ -1,22 +1,49 @@
+import hashlib
+import hmac
 import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass
 from dotenv import load_dotenv
-from typing import Annotated
+from typing import Annotated, Any
 import jwt
 from pwdlib import PasswordHash
 from datetime import datetime, timedelta, timezone
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
 from fastapi import HTTPException, Depends, status
-from petroapi.models import User
-from petroapi.database import get_db
+from petroapi.models import ApiKey, User, users_projects
+from petroapi.database import engine, get_db
 
 _ = load_dotenv()
 SECRET_KEY = str(os.environ.get("SECRET_KEY"))
 ALGORITHM = str(os.environ.get("ALGORITHM"))
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES"))
+REFRESH_TOKEN_EXPIRE_MINUTES = int(
+    os.environ.get("REFRESH_TOKEN_EXPIRE_MINUTES", 7 * 24 * 60)
+)
+# how long a worker trusts its copy of a user's membership version
+MEMBERSHIP_CACHE_SECONDS = float(os.environ.get("MEMBERSHIP_CACHE_SECONDS", 2))
 
 password_hash = PasswordHash.recommended()
 
+# user id -> (membership version, time it was read). The projects of access
+# tokens carrying an older version are not trusted but read again. The
+# version is reread from users.membership_version when the entry is older
+# than MEMBERSHIP_CACHE_SECONDS, so changes made on other workers apply
+# within that time, and after a restart on the first request.
+membership_versions: dict[int, tuple[int, float]] = {}
+membership_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class TokenUser:
+    id: int
+    username: str
+    projects: frozenset[int]
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return password_hash.verify(plain_password, hashed_password)
@@ -26,50 +53,163 @@ def get_password_hash(password: str) -> str:
     return password_hash.hash(password)
 
 
-def verify_token(token: str):
+def generate_api_key() -> tuple[str, str]:
+    # returns (prefix, key); only the prefix and a keyed hash of the key are stored
+    prefix = secrets.token_hex(6)
+    return prefix, f"{prefix}.{secrets.token_urlsafe(32)}"
+
+
+def get_api_key_hash(key: str) -> str:
+    return hmac.new(SECRET_KEY.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_api_key(key: str, db: Session) -> ApiKey | None:
+    prefix, _, _ = key.partition(".")
+    api_key = (
+        db.query(ApiKey)
+        .options(joinedload(ApiKey.user))
+        .filter_by(prefix=prefix)
+        .first()
+    )
+    if api_key is None:
+        return None
+    if not hmac.compare_digest(get_api_key_hash(key), api_key.hashed_key):
+        return None
+    return api_key
+
+
+def verify_token(token: str, token_type: str = "access") -> dict[str, Any] | None:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            return None
-        return username
     except jwt.PyJWTError:
         return None
+    if payload.get("type") != token_type or payload.get("uid") is None:
+        return None
+    return payload
 
 
-def create_access_token(data: dict[str, str | datetime]) -> str:
-    expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+def create_access_token(
+    data: dict[str, Any], expires_delta: timedelta | None = None
+) -> str:
+    if expires_delta is None:
+        expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
+    expire = datetime.now(timezone.utc) + expires_delta
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def create_user_tokens(user: User) -> tuple[str, str]:
+    membership_changed(user)
+    access_token = create_access_token(
+        data={
+            "type": "access",
+            "sub": user.username,
+            "uid": user.id,
+            "prj": sorted(project.id for project in user.projects),
+            "ver": user.membership_version,
+        }
+    )
+    refresh_token = create_access_token(
+        data={"type": "refresh", "sub": user.username, "uid": user.id},
+        expires_delta=timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES),
+    )
+    return access_token, refresh_token
+
+
+def membership_changed(user: User):
+    # call after commit, so the version is never ahead of the database
+    with membership_lock:
+        current, _ = membership_versions.get(user.id, (0, 0.0))
+        membership_versions[user.id] = (
+            max(current, user.membership_version),
+            time.monotonic(),
+        )
+
+
+def membership_version(user_id: int, db: Session | None = None) -> int | None:
+    # None if the user does not exist anymore
+    entry = membership_versions.get(user_id)
+    if entry is not None and time.monotonic() - entry[1] < MEMBERSHIP_CACHE_SECONDS:
+        return entry[0]
+    statement = select(User.membership_version).where(User.id == user_id)
+    if db is None:
+        with engine.connect() as conn:
+            version = conn.scalar(statement)
+    else:
+        version = db.scalar(statement)
+    if version is None:
+        membership_versions.pop(user_id, None)
+        return None
+    with membership_lock:
+        membership_versions[user_id] = (version, time.monotonic())
+    return version
+
+
+def token_current(payload: dict[str, Any], db: Session | None = None) -> bool:
+    # False if the membership changed after the token was issued
+    version = membership_version(payload["uid"], db)
+    return version is not None and payload.get("ver", 0) >= version
+
+
 # Define the OAuth2 scheme for token-based authentication
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+# API keys for machine clients are accepted as an alternative
+api_key_scheme = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 
 # routers depends
 
 
+def user_projects(user_id: int, db: Session) -> frozenset[int]:
+    return frozenset(
+        db.scalars(
+            select(users_projects.c.project_id).where(
+                users_projects.c.user_id == user_id
+            )
+        )
+    )
+
+
+def get_api_key_user(key: str, db: Session) -> TokenUser:
+    api_key = verify_api_key(key, db)
+    if api_key is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key",
+        )
+    return TokenUser(
+        id=api_key.user_id,
+        username=api_key.user.username,
+        projects=user_projects(api_key.user_id, db),
+    )
+
+
 async def get_current_user(
-    token: Annotated[str, Depends(oauth2_scheme)],
+    token: Annotated[str | None, Depends(oauth2_scheme)],
+    key: Annotated[str | None, Depends(api_key_scheme)],
     db: Annotated[Session, Depends(get_db)],
-):
-    username = verify_token(token)
-    if username is None:
+) -> TokenUser:
+    if token is None and key is not None:
+        return get_api_key_user(key, db)
+    payload = None if token is None else verify_token(token)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = db.query(User).filter_by(username=username).first()
-    if user is None:
+    version = membership_version(payload["uid"], db)
+    if version is None:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-    return user
+    projects = frozenset(payload.get("prj", []))
+    if payload.get("ver", 0) < version:
+        # membership changed after the token was issued, the projects are
+        # read from the database until the client refreshes the token
+        projects = user_projects(payload["uid"], db)
+    return TokenUser(id=payload["uid"], username=payload["sub"], projects=projects)
@@ -0,0 +1,239 @@
+from typing import Any
+
+from pydantic import ValidationError
+from sqlalchemy import inspect, select
+
+from petroapi.models import Area, Profile, ProfileSpot, Project, Sample, Spot
+from petroapi.schema import (
+    AreaCreateSchema,
+    AreaSchema,
+    ProfileCreateSchema,
+    ProfileSchema,
+    ProfileSpotCreateSchema,
+    ProfileSpotSchema,
+    SampleCreateSchema,
+    SampleSchema,
+    SpotCreateSchema,
+    SpotSchema,
+)
+
+# entity -> (model, create schema, response schema, parent, unique field)
+ENTITIES = {
+    "sample": (Sample, SampleCreateSchema, SampleSchema, None, "name"),
+    "spot": (Spot, SpotCreateSchema, SpotSchema, "sample", "label"),
+    "area": (Area, AreaCreateSchema, AreaSchema, "sample", "label"),
+    "profile": (Profile, ProfileCreateSchema, ProfileSchema, "sample", "label"),
+    "profilespot": (
+        ProfileSpot,
+        ProfileSpotCreateSchema,
+        ProfileSpotSchema,
+        "profile",
+        "index",
+    ),
+}
+# parent -> foreign key of the children
+PARENT_KEYS = {"sample": "sample_id", "profile": "profile_id"}
+
+
+class BatchError(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Batch:
+    # objects created by the batch are addressed by their ref, existing ones
+    # by id, access to every parent is resolved once per batch
+    def __init__(self, db, project: Project):
+        self.db = db
+        self.project = project
+        self.refs: dict[str, Any] = {}
+        self.unique: dict[tuple, set] = {}
+        self.touched: list = []
+        # profile id -> packed, read with a row lock once per batch
+        self.packed: dict[int, bool] = {}
+        self.results: list[tuple[str, str, Any, str | None]] = []
+
+    def prefetch(self, operations):
+        # one query per entity instead of one per operation, later lookups
+        # are served from the identity map
+        ids: dict[str, set[int]] = {}
+        for operation in operations:
+            if isinstance(operation.id, int):
+                ids.setdefault(operation.entity, set()).add(operation.id)
+            parent = ENTITIES[operation.entity][3]
+            if parent is not None and isinstance(operation.parent, int):
+                ids.setdefault(parent, set()).add(operation.parent)
+        for entity, entity_ids in ids.items():
+            model = ENTITIES[entity][0]
+            self.db.scalars(select(model).where(model.id.in_(entity_ids))).all()
+
+    def resolve(self, entity: str, key: int | str | None):
+        if key is None:
+            raise BatchError(f"Missing {entity} id")
+        if isinstance(key, str):
+            obj = self.refs.get(key)
+            if obj is None or not isinstance(obj, ENTITIES[entity][0]):
+                raise BatchError(f"Unknown {entity} ref {key}", 404)
+            return obj
+        obj = self.db.get(ENTITIES[entity][0], key)
+        if obj is None or obj in self.db.deleted or not self.owned(entity, obj):
+            raise BatchError(f"{entity.capitalize()} {key} not found", 404)
+        return obj
+
+    def owned(self, entity: str, obj) -> bool:
+        if entity == "sample":
+            return obj.project_id == self.project.id
+        parent = ENTITIES[entity][3]
+        try:
+            self.resolve(parent, getattr(obj, PARENT_KEYS[parent]))
+        except BatchError:
+            return False
+        return True
+
+    def parent(self, entity: str, obj):
+        parent_entity = ENTITIES[entity][3]
+        return self.project if parent_entity is None else getattr(obj, parent_entity)
+
+    def unique_values(self, entity: str, parent) -> set:
+        model, _, _, parent_entity, field = ENTITIES[entity]
+        column = PARENT_KEYS.get(parent_entity, "project_id")
+        key = (entity, id(parent))
+        if key not in self.unique:
+            # existing values of the parent, loaded once
+            self.unique[key] = set()
+            if parent not in self.db.new:
+                self.unique[key].update(
+                    self.db.scalars(
+                        select(getattr(model, field)).where(
+                            getattr(model, column) == parent.id
+                        )
+                    )
+                )
+        return self.unique[key]
+
+    def check_unique(self, entity: str, parent, value):
+        values = self.unique_values(entity, parent)
+        if value in values:
+            field = ENTITIES[entity][4]
+            raise BatchError(
+                f"{entity.capitalize()} with {field} {value} already exists"
+            )
+        values.add(value)
+
+    def touch(self, entity: str, obj):
+        # spots and profile spots change the version of their parent
+        if entity in ("spot", "area"):
+            self.touched.append(obj.sample)
+        elif entity == "profilespot":
+            if self.is_packed(obj.profile):
+                raise BatchError("Profile is packed", 409)
+            self.touched.append(obj.profile)
+
+    def is_packed(self, profile) -> bool:
+        if profile in self.db.new:
+            return profile.packed
+        if profile.id not in self.packed:
+            # locked until commit, the profile cannot be packed meanwhile
+            self.packed[profile.id] = self.db.scalar(
+                select(Profile.packed).where(Profile.id == profile.id).with_for_update()
+            )
+        return self.packed[profile.id]
+
+    def validate(self, schema, data: dict):
+        try:
+            return schema.model_validate(data)
+        except ValidationError as error:
+            raise BatchError(
+                "; ".join(
+                    f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}"
+                    for e in error.errors()
+                ),
+                422,
+            )
+
+    def create(self, operation):
+        model, schema, _, parent_entity, field = ENTITIES[operation.entity]
+        values = self.validate(schema, operation.data).model_dump()
+        if parent_entity is None:
+            parent = self.project
+            obj = model(**values, project=parent)
+        else:
+            parent = self.resolve(parent_entity, operation.parent)
+            obj = model(**values, **{parent_entity: parent})
+        self.check_unique(operation.entity, parent, values[field])
+        self.touch(operation.entity, obj)
+        self.db.add(obj)
+        if operation.ref is not None:
+            if operation.ref in self.refs:
+                raise BatchError(f"Duplicate ref {operation.ref}")
+            self.refs[operation.ref] = obj
+        return obj
+
+    def update(self, operation):
+        _, schema, _, _, field = ENTITIES[operation.entity]
+        obj = self.resolve(operation.entity, operation.id)
+        unknown = set(operation.data) - set(schema.model_fields)
+        if unknown:
+            raise BatchError(f"Unknown fields {', '.join(sorted(unknown))}")
+        current = {field: getattr(obj, field) for field in schema.model_fields}
+        values = self.validate(schema, {**current, **operation.data}).model_dump()
+        self.touch(operation.entity, obj)
+        if field in operation.data and values[field] != getattr(obj, field):
+            parent = self.parent(operation.entity, obj)
+            self.unique_values(operation.entity, parent).discard(getattr(obj, field))
+            self.check_unique(operation.entity, parent, values[field])
+        for key in operation.data:
+            setattr(obj, key, values[key])
+        return obj
+
+    def delete(self, operation):
+        field = ENTITIES[operation.entity][4]
+        obj = self.resolve(operation.entity, operation.id)
+        self.touch(operation.entity, obj)
+        # the label or name can be reused by a later create
+        parent = self.parent(operation.entity, obj)
+        self.unique_values(operation.entity, parent).discard(getattr(obj, field))
+        if obj in self.db.new:
+            # created by this batch, has to be inserted before deleted
+            self.db.flush()
+        self.db.delete(obj)
+        self.refs = {ref: value for ref, value in self.refs.items() if value is not obj}
+        return obj
+
+    def apply(self, operation):
+        obj = getattr(self, operation.op)(operation)
+        self.results.append((operation.op, operation.entity, obj, operation.ref))
+
+    def finish(self) -> list[dict]:
+        for parent in {id(obj): obj for obj in self.touched}.values():
+            if inspect(parent).persistent and parent not in self.db.deleted:
+                parent.version = type(parent).version + 1
+        # all inserts in one flush, batched per table
+        self.db.flush()
+        results = []
+        for op, entity, obj, ref in self.results:
+            schema = ENTITIES[entity][2]
+            results.append(
+                dict(
+                    op=op,
+                    entity=entity,
+                    id=obj.id,
+                    ref=ref,
+                    data=None if op == "delete" else schema.model_validate(obj),
+                )
+            )
+        return results
+
+
+def run(db, project: Project, operations) -> list[dict]:
+    batch = Batch(db, project)
+    batch.prefetch(operations)
+    # pending rows are tracked by the batch, not flushed by every lookup
+    with db.no_autoflush:
+        for n, operation in enumerate(operations):
+            try:
+                batch.apply(operation)
+            except BatchError as error:
+                raise BatchError(f"Operation {n}: {error}", error.status_code)
+    return batch.finish()
@@ -0,0 +1,162 @@
+from typing import Any
+
+from sqlalchemy import (
+    Float,
+    Integer,
+    String,
+    case,
+    cast,
+    column,
+    delete,
+    func,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+
+COLUMN_TYPES = {"label": String, "mineral": String, "index": Integer, "values": JSONB}
+
+
+class BulkError(ValueError):
+    pass
+
+
+def filter_conditions(model, criteria) -> list:
+    conditions = []
+    if criteria.ids is not None:
+        conditions.append(model.id.in_(criteria.ids))
+    if criteria.label is not None:
+        if not hasattr(model, "label"):
+            raise BulkError("Filter by label is not supported")
+        # shell-like wildcards, label=grt-* matches grt-1, grt-2..., other
+        # characters match literally
+        pattern = (
+            criteria.label.replace("\\", "\\\\")
+            .replace("%", "\\%")
+            .replace("_", "\\_")
+            .replace("*", "%")
+            .replace("?", "_")
+        )
+        conditions.append(model.label.like(pattern, escape="\\"))
+    if criteria.mineral is not None:
+        if not hasattr(model, "mineral"):
+            raise BulkError("Filter by mineral is not supported")
+        conditions.append(model.mineral == criteria.mineral)
+    if criteria.index_min is not None or criteria.index_max is not None:
+        if not hasattr(model, "index"):
+            raise BulkError("Filter by index is not supported")
+        if criteria.index_min is not None:
+            conditions.append(model.index >= criteria.index_min)
+        if criteria.index_max is not None:
+            conditions.append(model.index <= criteria.index_max)
+    if criteria.total_min is not None or criteria.total_max is not None:
+        total = oxide_total(model)
+        if criteria.total_min is not None:
+            conditions.append(total >= criteria.total_min)
+        if criteria.total_max is not None:
+            conditions.append(total <= criteria.total_max)
+    return conditions
+
+
+def oxide_total(model):
+    # sum of numeric values, computed in the database
+    each = func.jsonb_each(model.values).table_valued(
+        "key", column("value", JSONB), name="oxides"
+    )
+    return (
+        select(func.coalesce(func.sum(each.c.value.op("#>>")("{}").cast(Float)), 0))
+        .where(func.jsonb_typeof(each.c.value) == "number")
+        .scalar_subquery()
+    )
+
+
+def scaled_values(model, factors: dict[str, float]):
+    # multiply numeric oxides in place, missing or non-numeric ones are kept
+    scaled = func.jsonb_build_object(
+        *(
+            arg
+            for oxide, factor in factors.items()
+            for arg in (
+                oxide,
+                case(
+                    (
+                        func.jsonb_typeof(model.values.op("->")(oxide)) == "number",
+                        model.values.op("->>")(oxide).cast(Float) * factor,
+                    )
+                ),
+            )
+        )
+    )
+    return model.values.op("||")(func.jsonb_strip_nulls(scaled))
+
+
+def update_items(db, model, parent, parent_id: int, items: list[dict[str, Any]]):
+    # one UPDATE ... FROM (VALUES ...) per distinct set of updated fields,
+    # usually just one statement
+    groups: dict[tuple[str, ...], list[dict[str, Any]]] = {}
+    for item in items:
+        for field, value in item.items():
+            if value is None and field != "mineral":
+                raise BulkError(f"Field {field} of item {item['id']} cannot be null")
+        fields = tuple(sorted(field for field in item if field != "id"))
+        if fields:
+            groups.setdefault(fields, []).append(item)
+    updated = 0
+    for fields, group in groups.items():
+        rows = values(
+            column("id", Integer),
+            *(column(field, COLUMN_TYPES[field]) for field in fields),
+            name="items",
+        ).data([(item["id"], *(item[field] for field in fields)) for item in group])
+        changes = {}
+        for field in fields:
+            if field == "values":
+                # partial update, given oxides replace the stored ones
+                changes[field] = model.values.op("||")(cast(rows.c[field], JSONB))
+            else:
+                changes[field] = rows.c[field]
+        updated += db.execute(
+            update(model)
+            .where(model.id == rows.c.id)
+            .where(parent == parent_id)
+            .values(changes)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    return updated
+
+
+def update_filtered(db, model, parent, parent_id: int, criteria, changes: dict):
+    if not changes:
+        raise BulkError("Nothing to update")
+    conditions = filter_conditions(model, criteria)
+    if not conditions:
+        # as for deletes, a filter has to select something explicitly
+        raise BulkError("Empty filter")
+    return db.execute(
+        update(model)
+        .where(parent == parent_id)
+        .where(*conditions)
+        .values(changes)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def delete_filtered(db, model, parent, parent_id: int, criteria, dry_run=False):
+    conditions = filter_conditions(model, criteria)
+    if not conditions:
+        # deleting everything by accident is too easy otherwise
+        raise BulkError("Empty filter")
+    if dry_run:
+        return db.scalar(
+            select(func.count())
+            .select_from(model)
+            .where(parent == parent_id)
+            .where(*conditions)
+        )
+    return db.execute(
+        delete(model)
+        .where(parent == parent_id)
+        .where(*conditions)
+        .execution_options(synchronize_session=False)
+    ).rowcount
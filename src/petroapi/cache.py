@@ -0,0 +1,295 @@
+import os
+import select
+import threading
+from collections import OrderedDict
+from typing import Annotated
+
+import psycopg2
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from petroapi.auth import TokenUser, get_current_user, token_current, verify_token
+from petroapi.database import DATABASE_URL, engine
+from petroapi.metrics import match_route
+
+_ = load_dotenv()
+# total size of cached response bodies, 0 disables the cache
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# local (single worker) or postgres (LISTEN/NOTIFY between workers)
+CACHE_BROKER = os.environ.get("CACHE_BROKER", "local")
+# responses larger than this are not cached
+CACHE_MAX_ITEM_BYTES = CACHE_MAX_BYTES // 16
+
+router = APIRouter()
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lock = threading.Lock()
+        # key -> (project_id, route, headers, body)
+        self.entries: OrderedDict[tuple, tuple[int, str, list, bytes]] = OrderedDict()
+        self.projects: dict[int, set[tuple]] = {}
+        self.generations: dict[int, int] = {}
+        # bumped by invalidate_all, part of every project generation
+        self.epoch = 0
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+        self.invalidations = 0
+
+    def generation(self, project_id: int) -> int:
+        # only grows, a response computed before any invalidation never
+        # matches afterwards
+        return self.epoch + self.generations.get(project_id, 0)
+
+    def get(self, key: tuple, route: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses[route] = self.misses.get(route, 0) + 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits[route] = self.hits.get(route, 0) + 1
+            return entry[2], entry[3]
+
+    def put(self, key, project_id, route, headers, body, generation: int):
+        if len(body) > CACHE_MAX_ITEM_BYTES:
+            return
+        with self.lock:
+            # the project changed while the response was computed
+            if generation != self.generation(project_id):
+                return
+            self.discard(key)
+            self.entries[key] = (project_id, route, headers, body)
+            self.projects.setdefault(project_id, set()).add(key)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[3])
+            keys = self.projects.get(entry[0])
+            if keys is not None:
+                keys.discard(key)
+
+    def invalidate(self, project_id: int):
+        with self.lock:
+            self.generations[project_id] = self.generations.get(project_id, 0) + 1
+            for key in self.projects.pop(project_id, set()):
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.size -= len(entry[3])
+            self.invalidations += 1
+
+    def invalidate_all(self):
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+            self.projects.clear()
+            self.size = 0
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            hits = sum(self.hits.values())
+            misses = sum(self.misses.values())
+            routes = {
+                route: dict(
+                    hits=self.hits.get(route, 0),
+                    misses=self.misses.get(route, 0),
+                )
+                for route in sorted(set(self.hits) | set(self.misses))
+            }
+            return dict(
+                entries=len(self.entries),
+                bytes=self.size,
+                max_bytes=self.max_bytes,
+                hits=hits,
+                misses=misses,
+                hit_rate=hits / (hits + misses) if hits + misses else 0.0,
+                invalidations=self.invalidations,
+                routes=routes,
+            )
+
+
+# ---------------------------------- INVALIDATION BROKERS
+
+
+class LocalBroker:
+    # single worker, invalidations are applied in-process only
+    def publish(self, project_id: int):
+        pass
+
+    def start(self, callback):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PostgresBroker:
+    # fans invalidations out to all workers through LISTEN/NOTIFY
+    channel = "petroapi_cache"
+
+    def __init__(self):
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def publish(self, project_id: int):
+        with engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                dict(channel=self.channel, payload=str(project_id)),
+            )
+
+    def start(self, callback):
+        self.thread = threading.Thread(target=self.listen, args=(callback,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def listen(self, callback):
+        while not self.stopped.is_set():
+            try:
+                conn = psycopg2.connect(DATABASE_URL)
+            except psycopg2.OperationalError:
+                self.stopped.wait(5)
+                continue
+            try:
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.channel}")
+                while not self.stopped.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            callback(int(conn.notifies.pop(0).payload))
+            except psycopg2.Error:
+                # invalidations may have been missed, start from scratch
+                response_cache.invalidate_all()
+                self.stopped.wait(1)
+            finally:
+                conn.close()
+
+
+response_cache = ResponseCache(CACHE_MAX_BYTES)
+broker = PostgresBroker() if CACHE_BROKER == "postgres" else LocalBroker()
+
+
+async def invalidate(project_id: int):
+    response_cache.invalidate(project_id)
+    await run_in_threadpool(broker.publish, project_id)
+
+
+# ---------------------------------- MIDDLEWARE
+
+
+def project_user(scope, project_id: int) -> bool:
+    # only bearer tokens are checked here, other requests bypass the cache
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return False
+            payload = verify_token(token)
+            if payload is None:
+                return False
+            if not token_current(payload):
+                return False
+            return project_id in payload.get("prj", [])
+    return False
+
+
+class CacheMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or response_cache.max_bytes <= 0:
+            return await self.app(scope, receive, send)
+        route, params = match_route(scope)
+        project_id = params.get("project_id", params.get("pid"))
+        if route is None or project_id is None or not project_id.isdigit():
+            return await self.app(scope, receive, send)
+        project_id = int(project_id)
+        if scope["method"] != "GET":
+            return await self.write(scope, receive, send, project_id)
+
+        # may read the membership version, kept off the event loop
+        if not await run_in_threadpool(project_user, scope, project_id):
+            return await self.app(scope, receive, send)
+        key = (project_id, scope["path"], scope["query_string"])
+        headers = dict(scope["headers"])
+        if headers.get(b"x-read-your-writes", b"").lower() not in (b"1", b"true"):
+            entry = response_cache.get(key, route.path)
+            if entry is not None:
+                response_headers, body = entry
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 200,
+                        "headers": response_headers + [(b"x-cache", b"HIT")],
+                    }
+                )
+                await send({"type": "http.response.body", "body": body})
+                return
+
+        generation = response_cache.generation(project_id)
+        # shared with request.state, set by get_read_db
+        state = scope.setdefault("state", {})
+        start = {}
+        chunks = []
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal chunks, size
+            if message["type"] == "http.response.start":
+                start.update(message)
+                # event streams never end, they are not cached
+                if (b"content-type", b"text/event-stream") in [
+                    (name.lower(), value.split(b";")[0])
+                    for name, value in message["headers"]
+                ]:
+                    chunks = None
+                message = dict(message)
+                message["headers"] = list(message["headers"]) + [(b"x-cache", b"MISS")]
+            elif message["type"] == "http.response.body" and chunks is not None:
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+                # stop buffering large, e.g. streamed, responses
+                if size > CACHE_MAX_ITEM_BYTES:
+                    chunks = None
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if state.get("replica"):
+            return
+        if start.get("status") == 200 and chunks is not None:
+            response_cache.put(
+                key,
+                project_id,
+                route.path,
+                list(start["headers"]),
+                b"".join(chunks),
+                generation,
+            )
+
+    async def write(self, scope, receive, send, project_id: int):
+        async def send_wrapper(message):
+            # invalidate before the client sees the response of the write
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                await invalidate(project_id)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+@router.get("/cache/stats", include_in_schema=False)
+def get_cache_stats(user: Annotated[TokenUser, Depends(get_current_user)]):
+    return response_cache.stats()
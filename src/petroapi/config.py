@@ -1,22 +1,36 @@
 # controllers/customer_controller.py
 import os
 from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
 from petroapi.models import User
 from petroapi.auth import get_password_hash
-from petroapi.database import SessionLocal
+from petroapi.database import Base, engine
+from petroapi.events import install as install_events
+from petroapi.revisions import install as install_revisions
 
 _ = load_dotenv()
 ADMIN_PASSWORD = str(os.environ.get("ADMIN_PASSWORD"))
+SKIP_SCHEMA_SYNC = os.environ.get("SKIP_SCHEMA_SYNC", "").lower() in ("1", "true")
 
+# key of the advisory lock serializing startup of concurrent workers
+INIT_LOCK_KEY = 7301
 
-def init_db():
-    with SessionLocal() as db:
-        user = db.query(User).filter(User.username == "admin").first()
-        if not user:
-            new_user = User(
-                username="admin",
-                email=os.environ.get("ADMIN_EMAIL"),
-                hashed_password=get_password_hash(ADMIN_PASSWORD),
-            )
-            db.add(new_user)
-            db.commit()
+
+def init_db(skip_schema_sync: bool = SKIP_SCHEMA_SYNC):
+    with engine.begin() as conn:
+        conn.execute(select(func.pg_advisory_xact_lock(INIT_LOCK_KEY)))
+        if not skip_schema_sync:
+            Base.metadata.create_all(conn)
+            install_revisions(conn)
+            install_events(conn)
+        with Session(bind=conn) as db:
+            user = db.query(User).filter(User.username == "admin").first()
+            if not user:
+                new_user = User(
+                    username="admin",
+                    email=os.environ.get("ADMIN_EMAIL"),
+                    hashed_password=get_password_hash(ADMIN_PASSWORD),
+                )
+                db.add(new_user)
+                db.flush()
@@ -1,6 +1,13 @@
+import itertools
 import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import Engine, create_engine, event, text
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 _ = load_dotenv()
@@ -10,6 +17,12 @@ DBNAME = str(os.environ.get("DBNAME"))
 DBUSER = str(os.environ.get("DBUSER"))
 DBPASSWORD = str(os.environ.get("DBPASSWORD"))
 DATABASE_URL = f"postgresql://{DBUSER}:{DBPASSWORD}@{DBHOST}/{DBNAME}"
+# comma separated host:port of read replicas of the same database
+DBREPLICAS = [
+    host.strip() for host in os.environ.get("DBREPLICAS", "").split(",") if host.strip()
+]
+# replicas are probed at most this often, failed ones are skipped meanwhile
+REPLICA_CHECK_SECONDS = 10
 
 engine = create_engine(DATABASE_URL)
 
@@ -26,3 +39,116 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ---------------------------------- QUERY STATS
+
+
+@dataclass
+class QueryStats:
+    statements: int = 0
+    duration: float = 0.0
+    # (statement, parameters, duration) of every query, when profiled
+    queries: list[tuple[str, Any, float]] | None = field(default=None)
+
+
+# set per request by the metrics middleware; the object is shared with the
+# threadpool running sync routes, so it is mutated rather than replaced
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = query_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.duration += elapsed
+        if stats.queries is not None and not executemany:
+            stats.queries.append((statement, parameters, elapsed))
+
+
+def instrument(engine: Engine):
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+instrument(engine)
+
+
+# ---------------------------------- READ REPLICAS
+
+
+class Replica:
+    def __init__(self, host: str):
+        self.host = host
+        self.engine = create_engine(
+            f"postgresql://{DBUSER}:{DBPASSWORD}@{host}/{DBNAME}",
+            pool_pre_ping=True,
+            connect_args={"connect_timeout": 2},
+        )
+        self.healthy = True
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        instrument(self.engine)
+        event.listen(self.engine, "handle_error", self.handle_error)
+
+    def handle_error(self, context):
+        if context.is_disconnect:
+            self.healthy = False
+            self.checked = time.monotonic()
+
+    def available(self) -> bool:
+        if time.monotonic() - self.checked < REPLICA_CHECK_SECONDS:
+            return self.healthy
+        # one request probes the replica, others keep the last known state
+        if not self.lock.acquire(blocking=False):
+            return self.healthy
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            self.healthy = True
+        except Exception:
+            self.healthy = False
+        finally:
+            self.checked = time.monotonic()
+            self.lock.release()
+        return self.healthy
+
+
+class ReplicaPool:
+    def __init__(self, hosts: list[str]):
+        self.replicas = [Replica(host) for host in hosts]
+        self.counter = itertools.count()
+
+    def get(self) -> Engine | None:
+        # round-robin over available replicas, None when all are down
+        n = len(self.replicas)
+        start = next(self.counter)
+        for i in range(n):
+            replica = self.replicas[(start + i) % n]
+            if replica.available():
+                return replica.engine
+        return None
+
+
+replicas = ReplicaPool(DBREPLICAS)
+
+
+def get_read_db(request: Request):
+    # X-Read-Your-Writes: true forces the primary to see own recent writes
+    bind = None
+    if request.headers.get("X-Read-Your-Writes", "").lower() not in ("1", "true"):
+        bind = replicas.get()
+    if bind is not None:
+        # a lagging replica may answer with data older than the cache
+        # generation, the response cache skips these responses
+        request.state.replica = True
+    db = SessionLocal(bind=bind) if bind is not None else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,110 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from petroapi.models import Profile, Sample, Spot
+from petroapi.series import SeriesCache, SeriesError, number, read_series
+
+_ = load_dotenv()
+# number of computed profiles and samples kept in memory
+ENDMEMBER_CACHE_SIZE = int(os.environ.get("ENDMEMBER_CACHE_SIZE", 256))
+
+# oxide -> (cation, molar mass, cations per formula)
+OXIDES = {
+    "SiO2": ("Si", 60.084, 1),
+    "TiO2": ("Ti", 79.866, 1),
+    "Al2O3": ("Al", 101.961, 2),
+    "Cr2O3": ("Cr", 151.990, 2),
+    "FeO": ("Fe", 71.844, 1),
+    "Fe2O3": ("Fe", 159.688, 2),
+    "MnO": ("Mn", 70.937, 1),
+    "MgO": ("Mg", 40.304, 1),
+    "CaO": ("Ca", 56.077, 1),
+    "Na2O": ("Na", 61.979, 2),
+    "K2O": ("K", 94.196, 2),
+}
+
+
+@dataclass(frozen=True)
+class Scheme:
+    # end-member -> cation, fractions are cation proportions
+    endmembers: dict[str, str]
+
+    def fractions(self, oxides: list[str], values: np.ndarray) -> np.ndarray:
+        # values has one row of wt% per oxide, missing oxides count as zero
+        cations = sorted(set(self.endmembers.values()))
+        matrix = np.zeros((len(cations), len(oxides)))
+        for j, oxide in enumerate(oxides):
+            cation, mass, n = OXIDES.get(oxide, (None, 1, 0))
+            if cation in cations:
+                matrix[cations.index(cation), j] += n / mass
+        moles = matrix @ np.nan_to_num(values)
+        total = moles.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fractions = np.where(total > 0, moles / total, np.nan)
+        return fractions[[cations.index(c) for c in self.endmembers.values()]]
+
+
+# mineral -> scheme, add entries to support more minerals
+SCHEMES = {
+    "Grt": Scheme({"Alm": "Fe", "Prp": "Mg", "Grs": "Ca", "Sps": "Mn"}),
+    "Pl": Scheme({"An": "Ca", "Ab": "Na", "Or": "K"}),
+    "Px": Scheme({"Wo": "Ca", "En": "Mg", "Fs": "Fe"}),
+}
+SCHEMES["Kfs"] = SCHEMES["Pl"]
+SCHEMES["Cpx"] = SCHEMES["Opx"] = SCHEMES["Px"]
+
+endmember_cache = SeriesCache(ENDMEMBER_CACHE_SIZE)
+
+
+def scheme_for(mineral: str | None) -> Scheme:
+    scheme = SCHEMES.get(mineral or "")
+    if scheme is None:
+        raise SeriesError(f"No end-member scheme for mineral {mineral}")
+    return scheme
+
+
+def result(scheme: Scheme, oxides, values, keys: dict[str, list]):
+    n = len(next(iter(keys.values())))
+    y = np.asarray(values, dtype=float).reshape(len(oxides), n)
+    fractions = scheme.fractions(oxides, y)
+    for name, data in zip(scheme.endmembers, fractions):
+        keys[name] = [None if np.isnan(v) else round(float(v), 6) for v in data]
+    return keys
+
+
+def profile_endmembers(db, profile: Profile, mineral: str | None = None):
+    mineral = mineral or profile.mineral
+    scheme = scheme_for(mineral)
+    # the version changes with every write to the profile spots
+    key = ("profile", profile.id, profile.version, mineral)
+    cached = endmember_cache.get(key)
+    if cached is None:
+        index, oxides, values = read_series(db, profile)
+        cached = result(scheme, oxides, values, {"index": list(index)})
+        endmember_cache.put(key, cached)
+    return cached
+
+
+def sample_endmembers(db, sample: Sample, mineral: str):
+    scheme = scheme_for(mineral)
+    key = ("sample", sample.id, sample.version, mineral)
+    cached = endmember_cache.get(key)
+    if cached is None:
+        rows = db.execute(
+            select(Spot.id, Spot.label, Spot.values)
+            .where(Spot.sample_id == sample.id)
+            .where(Spot.mineral == mineral)
+            .order_by(Spot.id)
+        ).all()
+        oxides = list(dict.fromkeys(oxide for row in rows for oxide in row.values))
+        values = [
+            [number(row.values.get(oxide), False) for row in rows] for oxide in oxides
+        ]
+        keys = {"id": [row.id for row in rows], "label": [row.label for row in rows]}
+        cached = result(scheme, oxides, values, keys)
+        endmember_cache.put(key, cached)
+    return cached
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+import select
+import threading
+
+import psycopg2
+from dotenv import load_dotenv
+
+from petroapi.database import DATABASE_URL
+from petroapi.revisions import REVISION_DEFAULT, ROWS, installed
+
+_ = load_dotenv()
+# pending events per client, a slow client gets a reset event instead
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", 1000))
+# changed ids sent with an event, larger changes are sent as a count only
+EVENT_MAX_IDS = 100
+
+EVENTS_DDL_VERSION = 2
+CHANNEL = "petroapi_events"
+
+
+# ---------------------------------- SCHEMA
+
+
+def ddl() -> list[str]:
+    # one notification per statement and project, sent by Postgres on commit,
+    # so every writer is covered, rolled back changes are never announced.
+    # Updated rows keep their revision when only the version of a sample or
+    # profile was bumped, these updates are not announced either.
+    statements = []
+    for table, (entity, key, project, joins) in ROWS.items():
+        action = "CASE TG_OP WHEN 'INSERT' THEN 'create' ELSE 'update' END"
+        if table in ("projects", "samples"):
+            action = (
+                f"CASE WHEN o.deleted_at IS NOT NULL THEN 'delete' ELSE {action} END"
+            )
+        statements += [
+            f"CREATE OR REPLACE FUNCTION petroapi_events_{table}() "
+            "RETURNS trigger AS $$ BEGIN "
+            f"PERFORM pg_notify('{CHANNEL}', json_build_object("
+            f"'project_id', c.project_id, 'entity', '{entity}', "
+            "'action', c.action, 'revision', "
+            f"{REVISION_DEFAULT}, 'count', c.n, "
+            f"'ids', CASE WHEN c.n <= {EVENT_MAX_IDS} THEN c.ids END)::text) "
+            f"FROM (SELECT {project} AS project_id, "
+            f"CASE WHEN TG_OP = 'DELETE' THEN 'delete' ELSE {action} END AS action, "
+            f"count(*) AS n, (array_agg({key} ORDER BY {key}))[1:{EVENT_MAX_IDS}] "
+            f"AS ids FROM changed_rows o {joins} "
+            f"WHERE TG_OP <> 'UPDATE' OR o.revision = {REVISION_DEFAULT} "
+            "GROUP BY 1, 2) c; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+        ]
+        for op, rows in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            trigger = f"petroapi_events_{op.lower()}"
+            statements += [
+                f"DROP TRIGGER IF EXISTS {trigger} ON {table}",
+                f"CREATE TRIGGER {trigger} AFTER {op} ON {table} "
+                f"REFERENCING {rows} TABLE AS changed_rows FOR EACH STATEMENT "
+                f"EXECUTE FUNCTION petroapi_events_{table}()",
+            ]
+    statements.append(
+        f"COMMENT ON FUNCTION petroapi_events_projects() IS '{EVENTS_DDL_VERSION}'"
+    )
+    return statements
+
+
+def install(conn):
+    if installed(conn, "petroapi_events_projects", EVENTS_DDL_VERSION):
+        return
+    for statement in ddl():
+        conn.exec_driver_sql(statement)
+
+
+# ---------------------------------- HUB
+
+
+class EventHub:
+    # one LISTEN connection per worker, events are handed to the asyncio
+    # queues of the clients subscribed to the project
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers: dict[int, set[tuple]] = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def subscribe(self, project_id: int) -> tuple:
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(EVENT_QUEUE_SIZE))
+        with self.lock:
+            self.subscribers.setdefault(project_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, project_id: int, subscriber: tuple):
+        with self.lock:
+            subscribers = self.subscribers.get(project_id, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self.subscribers.pop(project_id, None)
+
+    def publish(self, project_id: int | None, event: dict):
+        with self.lock:
+            if project_id is None:
+                targets = set().union(*self.subscribers.values())
+            else:
+                targets = set(self.subscribers.get(project_id, ()))
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(deliver, queue, event)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.listen)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def listen(self):
+        while not self.stopped.is_set():
+            try:
+                conn = psycopg2.connect(DATABASE_URL)
+            except psycopg2.OperationalError:
+                self.stopped.wait(5)
+                continue
+            try:
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {CHANNEL}")
+                while not self.stopped.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            event = json.loads(conn.notifies.pop(0).payload)
+                            self.publish(event["project_id"], event)
+            except psycopg2.Error:
+                # events may have been missed, clients have to refetch
+                self.publish(None, dict(action="reset"))
+                self.stopped.wait(1)
+            finally:
+                conn.close()
+
+
+def deliver(queue: asyncio.Queue, event: dict):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # the client fell behind, drop its backlog and let it refetch
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(dict(action="reset"))
+
+
+hub = EventHub()
@@ -0,0 +1,271 @@
+import argparse
+import csv
+import io
+import json
+import random
+import time
+
+from sqlalchemy import insert, select, update
+
+from petroapi.config import init_db
+from petroapi.database import engine
+from petroapi.models import Profile, Project, Sample, User, users_projects
+
+# mean composition (wt%) and relative standard deviation of common minerals
+MINERALS = {
+    "Grt": (
+        {
+            "SiO2": 37.5,
+            "TiO2": 0.05,
+            "Al2O3": 21.0,
+            "FeO": 30.0,
+            "MnO": 2.0,
+            "MgO": 4.0,
+            "CaO": 5.0,
+        },
+        0.04,
+    ),
+    "Pl": (
+        {"SiO2": 60.0, "Al2O3": 25.0, "CaO": 6.5, "Na2O": 7.8, "K2O": 0.3},
+        0.05,
+    ),
+    "Kfs": ({"SiO2": 64.5, "Al2O3": 18.5, "Na2O": 1.0, "K2O": 15.5}, 0.03),
+    "Bt": (
+        {
+            "SiO2": 35.5,
+            "TiO2": 2.5,
+            "Al2O3": 19.0,
+            "FeO": 20.0,
+            "MnO": 0.15,
+            "MgO": 9.0,
+            "Na2O": 0.2,
+            "K2O": 9.2,
+        },
+        0.06,
+    ),
+    "Ms": (
+        {
+            "SiO2": 46.0,
+            "TiO2": 0.8,
+            "Al2O3": 35.0,
+            "FeO": 1.2,
+            "MgO": 0.8,
+            "Na2O": 0.8,
+            "K2O": 10.5,
+        },
+        0.05,
+    ),
+    "Qz": ({"SiO2": 99.8}, 0.002),
+    "Cpx": (
+        {
+            "SiO2": 52.0,
+            "TiO2": 0.4,
+            "Al2O3": 3.0,
+            "FeO": 8.0,
+            "MnO": 0.2,
+            "MgO": 14.0,
+            "CaO": 21.5,
+            "Na2O": 0.6,
+        },
+        0.06,
+    ),
+    "Amp": (
+        {
+            "SiO2": 44.0,
+            "TiO2": 1.2,
+            "Al2O3": 12.0,
+            "FeO": 15.0,
+            "MnO": 0.25,
+            "MgO": 11.0,
+            "CaO": 11.5,
+            "Na2O": 1.6,
+            "K2O": 0.6,
+        },
+        0.06,
+    ),
+    "Ilm": ({"TiO2": 52.0, "FeO": 45.0, "MnO": 1.5, "MgO": 0.5}, 0.03),
+}
+
+
+def analysis(rng: random.Random, composition: dict[str, float], rsd: float):
+    return {
+        oxide: round(max(rng.gauss(value, value * rsd + 0.01), 0.0), 3)
+        for oxide, value in composition.items()
+    }
+
+
+def spot_values(rng: random.Random, mineral: str):
+    return analysis(rng, *MINERALS[mineral])
+
+
+def area_values(rng: random.Random):
+    # modal mixture of a few phases, approximates a bulk rock composition
+    phases = rng.sample(sorted(MINERALS), 4)
+    weights = [rng.random() for _ in phases]
+    total = sum(weights)
+    values = {}
+    for phase, weight in zip(phases, weights):
+        for oxide, value in MINERALS[phase][0].items():
+            values[oxide] = values.get(oxide, 0.0) + value * weight / total
+    return analysis(rng, values, 0.02)
+
+
+def profile_values(rng: random.Random, mineral: str, position: float):
+    # zoning with core at position 0.5 and rims at 0 and 1
+    d = abs(2 * position - 1)
+    composition = dict(MINERALS[mineral][0])
+    if mineral == "Grt":
+        # prograde growth zoning: Mn bell-shaped, Mg and Fe increase to rims
+        composition["MnO"] = 0.5 + 6.0 * (1 - d) ** 2
+        composition["CaO"] = 3.5 + 3.0 * (1 - d)
+        composition["MgO"] = 2.0 + 3.0 * d
+        composition["FeO"] = 39.0 - composition["MnO"] - composition["CaO"] / 2
+    elif mineral == "Pl":
+        # normal zoning: calcic core, sodic rim
+        composition["CaO"] = 3.0 + 7.0 * (1 - d)
+        composition["Na2O"] = 9.5 - 3.8 * (1 - d)
+    return analysis(rng, composition, 0.01)
+
+
+class Loader:
+    def __init__(self, connection, chunk_size: int):
+        self.cursor = connection.connection.cursor()
+        self.chunk_size = chunk_size
+        self.rows = 0
+
+    def copy(self, table: str, columns: tuple[str, ...], rows):
+        sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        n = 0
+        for row in rows:
+            writer.writerow(row)
+            n += 1
+            if n % self.chunk_size == 0:
+                self.flush(sql, buffer)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+        self.flush(sql, buffer)
+        self.rows += n
+
+    def flush(self, sql: str, buffer: io.StringIO):
+        if buffer.tell():
+            buffer.seek(0)
+            self.cursor.copy_expert(sql, buffer)
+
+
+def spot_rows(rng: random.Random, sample_id: int, n: int):
+    minerals = sorted(MINERALS)
+    for i in range(n):
+        mineral = rng.choice(minerals)
+        yield sample_id, f"spot-{i}", mineral, json.dumps(spot_values(rng, mineral))
+
+
+def area_rows(rng: random.Random, sample_id: int, n: int):
+    for i in range(n):
+        yield sample_id, f"area-{i}", json.dumps(area_values(rng))
+
+
+def profilespot_rows(rng: random.Random, profiles: list[tuple[int, str]], n: int):
+    for profile_id, mineral in profiles:
+        for i in range(n):
+            values = profile_values(rng, mineral, i / max(n - 1, 1))
+            yield profile_id, i, json.dumps(values)
+
+
+def generate_sample(loader, conn, args, seed: int, sample_id: int):
+    rng = random.Random(seed)
+    loader.copy(
+        "spots",
+        ("sample_id", "label", "mineral", "values"),
+        spot_rows(rng, sample_id, args.spots),
+    )
+    loader.copy(
+        "areas", ("sample_id", "label", "values"), area_rows(rng, sample_id, args.areas)
+    )
+    if not args.profiles:
+        return
+    profile_minerals = [rng.choice(["Grt", "Grt", "Pl"]) for _ in range(args.profiles)]
+    profile_ids = conn.scalars(
+        insert(Profile).returning(Profile.id, sort_by_parameter_order=True),
+        [
+            dict(sample_id=sample_id, label=f"profile-{i}", mineral=mineral)
+            for i, mineral in enumerate(profile_minerals)
+        ],
+    ).all()
+    loader.copy(
+        "profilespots",
+        ("profile_id", "index", "values"),
+        profilespot_rows(
+            rng, list(zip(profile_ids, profile_minerals)), args.profile_points
+        ),
+    )
+
+
+def generate(args):
+    init_db()
+    start = time.perf_counter()
+    rows = 0
+    with engine.begin() as conn:
+        owner = conn.scalars(select(User.id).filter_by(username=args.owner)).first()
+    if owner is None:
+        raise SystemExit(f"User {args.owner} not found")
+    for p in range(args.projects):
+        # each project has its own seed, so any part can be regenerated alone
+        project_seed = args.seed * 1_000_003 + p
+        with engine.begin() as conn:
+            loader = Loader(conn, args.chunk_size)
+            project_id = conn.scalar(
+                insert(Project)
+                .values(
+                    name=f"{args.prefix}-{p}",
+                    description=f"synthetic dataset, seed {args.seed}",
+                )
+                .returning(Project.id)
+            )
+            conn.execute(
+                insert(users_projects).values(user_id=owner, project_id=project_id)
+            )
+            sample_ids = conn.scalars(
+                insert(Sample).returning(Sample.id, sort_by_parameter_order=True),
+                [
+                    dict(project_id=project_id, name=f"S{s}", description="synthetic")
+                    for s in range(args.samples)
+                ],
+            ).all()
+            for s, sample_id in enumerate(sample_ids):
+                generate_sample(
+                    loader, conn, args, project_seed * 1_000_003 + s, sample_id
+                )
+            conn.execute(
+                update(User)
+                .filter_by(id=owner)
+                .values(membership_version=User.membership_version + 1)
+            )
+        rows += loader.rows + 1 + args.samples + args.samples * args.profiles
+        elapsed = time.perf_counter() - start
+        print(
+            f"project {p + 1}/{args.projects}: {rows} rows "
+            f"in {elapsed:.1f} s ({rows / elapsed:.0f} rows/s)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Populate the database with a synthetic petrological dataset"
+    )
+    parser.add_argument("--projects", type=int, default=1)
+    parser.add_argument("--samples", type=int, default=10, help="per project")
+    parser.add_argument("--spots", type=int, default=1000, help="per sample")
+    parser.add_argument("--areas", type=int, default=20, help="per sample")
+    parser.add_argument("--profiles", type=int, default=2, help="per sample")
+    parser.add_argument("--profile-points", type=int, default=500, help="per profile")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--owner", default="admin", help="username owning projects")
+    parser.add_argument("--prefix", default="synthetic", help="project name prefix")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="rows per COPY")
+    generate(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
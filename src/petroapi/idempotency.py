@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from datetime import timedelta
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from petroapi.auth import get_api_key_hash, verify_token
+from petroapi.database import engine
+from petroapi.models import IdempotencyKey
+
+_ = load_dotenv()
+# how long a response is replayed for the same key
+IDEMPOTENCY_TTL = timedelta(
+    seconds=int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+)
+# larger responses are not kept, a retry gets a 409 instead of the body
+IDEMPOTENCY_MAX_BYTES = int(os.environ.get("IDEMPOTENCY_MAX_BYTES", 4 * 1024 * 1024))
+# running request without response for this long is considered dead
+IDEMPOTENCY_STALE_AFTER = timedelta(minutes=10)
+CLEANUP_INTERVAL_SECONDS = 600
+CLEANUP_BATCH_SIZE = 10000
+# request bodies up to this size are spooled in memory, larger ones on disk
+SPOOL_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger("petroapi.idempotency")
+stopping = threading.Event()
+
+
+# ---------------------------------- STORE
+
+
+def claim(owner: str, key: str, fingerprint: str):
+    # returns (outcome, stored key), the first request of a key runs, later
+    # ones wait for it or replay its response
+    with engine.begin() as conn:
+        claimed = conn.execute(
+            insert(IdempotencyKey)
+            .values(
+                owner=owner,
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=func.now() + IDEMPOTENCY_TTL,
+            )
+            .on_conflict_do_nothing(index_elements=["owner", "key"])
+            .returning(IdempotencyKey.id)
+        ).first()
+        if claimed is not None:
+            return "run", None
+        stored = conn.execute(
+            select(
+                IdempotencyKey,
+                (IdempotencyKey.expires_at <= func.now()).label("expired"),
+                (
+                    IdempotencyKey.created_at <= func.now() - IDEMPOTENCY_STALE_AFTER
+                ).label("stale"),
+            )
+            .where(IdempotencyKey.owner == owner)
+            .where(IdempotencyKey.key == key)
+            .with_for_update()
+        ).first()
+        if stored is None:
+            # released by a failed request meanwhile
+            return "running", None
+        if stored.expired or (stored.status_code is None and stored.stale):
+            conn.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.id == stored.id)
+                .values(
+                    fingerprint=fingerprint,
+                    status_code=None,
+                    content_type=None,
+                    body=None,
+                    created_at=func.now(),
+                    expires_at=func.now() + IDEMPOTENCY_TTL,
+                )
+            )
+            return "run", None
+        if stored.fingerprint != fingerprint:
+            return "mismatch", None
+        if stored.status_code is None:
+            return "running", None
+        return "replay", stored
+
+
+def store(owner: str, key: str, status_code: int, content_type, body):
+    with engine.begin() as conn:
+        conn.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.owner == owner)
+            .where(IdempotencyKey.key == key)
+            .values(
+                status_code=status_code,
+                content_type=content_type,
+                body=None if body is None else zlib.compress(body),
+                expires_at=func.now() + IDEMPOTENCY_TTL,
+            )
+        )
+
+
+def release(owner: str, key: str):
+    # the request failed, a retry runs it again
+    with engine.begin() as conn:
+        conn.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.owner == owner)
+            .where(IdempotencyKey.key == key)
+        )
+
+
+def cleanup() -> int:
+    deleted = 0
+    while not stopping.is_set():
+        batch = (
+            select(IdempotencyKey.id)
+            .where(IdempotencyKey.expires_at <= func.now())
+            .limit(CLEANUP_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        with engine.begin() as conn:
+            n = conn.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.id.in_(batch))
+            ).rowcount
+        deleted += n
+        if n < CLEANUP_BATCH_SIZE:
+            break
+    return deleted
+
+
+def run_cleanup():
+    while not stopping.wait(CLEANUP_INTERVAL_SECONDS):
+        try:
+            deleted = cleanup()
+        except Exception:
+            logger.exception("Cleanup of idempotency keys failed")
+            continue
+        if deleted:
+            logger.info("Deleted %d expired idempotency keys", deleted)
+
+
+def start():
+    thread = threading.Thread(target=run_cleanup, name="idempotency")
+    thread.daemon = True
+    thread.start()
+
+
+def shutdown():
+    stopping.set()
+
+
+# ---------------------------------- MIDDLEWARE
+
+
+def request_owner(headers: dict[bytes, bytes]) -> str | None:
+    # keys are scoped to the client, unauthenticated requests are not tracked
+    authorization = headers.get(b"authorization")
+    if authorization is not None:
+        scheme, _, token = authorization.decode("latin-1").partition(" ")
+        payload = verify_token(token) if scheme.lower() == "bearer" else None
+        return None if payload is None else f"user:{payload['uid']}"
+    api_key = headers.get(b"x-api-key")
+    if api_key is not None:
+        return f"key:{get_api_key_hash(api_key.decode('latin-1'))[:48]}"
+    return None
+
+
+async def spool(scope, receive):
+    # the body is hashed before the request runs and replayed to the app
+    digest = hashlib.sha256()
+    digest.update(f"{scope['method']} {scope['path']}?".encode())
+    digest.update(scope["query_string"] + b"\n")
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            return None, None
+        chunk = message.get("body", b"")
+        digest.update(chunk)
+        body.write(chunk)
+        more = message.get("more_body", False)
+    body.seek(0)
+    return body, digest.hexdigest()
+
+
+def replayed(body, receive):
+    size = body.seek(0, os.SEEK_END)
+    body.seek(0)
+
+    async def receive_wrapper():
+        if body.closed:
+            return await receive()
+        chunk = body.read(CHUNK_SIZE)
+        more = body.tell() < size
+        if not more:
+            body.close()
+        return {"type": "http.request", "body": chunk, "more_body": more}
+
+    return receive_wrapper
+
+
+async def respond(send, status_code: int, body: bytes, content_type, replay=False):
+    headers = [(b"content-length", str(len(body)).encode())]
+    if content_type is not None:
+        headers.append((b"content-type", content_type.encode("latin-1")))
+    if replay:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send(
+        {"type": "http.response.start", "status": status_code, "headers": headers}
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def error(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await respond(send, status_code, body, "application/json")
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        key = headers.get(b"idempotency-key")
+        owner = request_owner(headers)
+        if key is None or owner is None:
+            return await self.app(scope, receive, send)
+        key = key.decode("latin-1")
+        if not 0 < len(key) <= 255:
+            return await error(send, 400, "Invalid Idempotency-Key")
+        body, fingerprint = await spool(scope, receive)
+        if body is None:
+            return
+        outcome, stored = await run_in_threadpool(claim, owner, key, fingerprint)
+        if outcome != "run":
+            body.close()
+        if outcome == "mismatch":
+            return await error(
+                send, 422, "Idempotency-Key was used for a different request"
+            )
+        if outcome == "running":
+            return await error(
+                send, 409, "Request with this Idempotency-Key is in progress"
+            )
+        if outcome == "replay":
+            if stored.body is None:
+                return await error(
+                    send, 409, "Request was processed, response is too large to replay"
+                )
+            return await respond(
+                send,
+                stored.status_code,
+                zlib.decompress(stored.body),
+                stored.content_type,
+                replay=True,
+            )
+
+        start = {}
+        chunks = []
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal chunks, size
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body" and chunks is not None:
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+                if size > IDEMPOTENCY_MAX_BYTES:
+                    chunks = None
+            await send(message)
+
+        try:
+            await self.app(scope, replayed(body, receive), send_wrapper)
+        except BaseException:
+            await run_in_threadpool(release, owner, key)
+            raise
+        finally:
+            body.close()
+        status_code = start.get("status", 500)
+        if status_code >= 500 or status_code == 401:
+            return await run_in_threadpool(release, owner, key)
+        content_type = dict(start.get("headers", [])).get(b"content-type")
+        await run_in_threadpool(
+            store,
+            owner,
+            key,
+            status_code,
+            None if content_type is None else content_type.decode("latin-1"),
+            None if chunks is None else b"".join(chunks),
+        )
@@ -0,0 +1,146 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from petroapi.cache import broker, response_cache
+from petroapi.database import SessionLocal
+from petroapi.models import Area, Job, Profile, ProfileSpot, Sample, Spot
+
+_ = load_dotenv()
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_CHUNK_SIZE = int(os.environ.get("JOB_CHUNK_SIZE", 5000))
+# running job without progress for this long is considered dead
+JOB_STALE_AFTER = timedelta(minutes=10)
+
+# kind -> (model, parent column, unique column)
+IMPORTS = {
+    "spots": (Spot, "sample_id", "label"),
+    "areas": (Area, "sample_id", "label"),
+    "profilespots": (ProfileSpot, "profile_id", "index"),
+}
+
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+stopping = threading.Event()
+
+
+def insert_chunk(db: Session, job: Job, chunk: list[dict]):
+    model, parent, unique = IMPORTS[job.kind]
+    parent_column = getattr(model, parent)
+    unique_column = getattr(model, unique)
+    if model is ProfileSpot:
+        # the profile may have been packed after the job was submitted.
+        # pack_profile takes the same row lock, so the profile is not packed
+        # while the chunk is inserted
+        packed = db.scalar(
+            select(Profile.packed).where(Profile.id == job.parent_id).with_for_update()
+        )
+        if packed:
+            raise ValueError("Profile is packed")
+    existing = db.scalars(
+        select(unique_column)
+        .where(parent_column == job.parent_id)
+        .where(unique_column.in_([item[unique] for item in chunk]))
+        .limit(1)
+    ).first()
+    if existing is not None:
+        raise ValueError(f"{model.__name__} with {unique} {existing} already exists")
+    db.execute(insert(model), [dict(item, **{parent: job.parent_id}) for item in chunk])
+    # sample or profile version, invalidates derived data
+    parent_model = Profile if model is ProfileSpot else Sample
+    db.execute(
+        update(parent_model)
+        .where(parent_model.id == job.parent_id)
+        .values(version=parent_model.version + 1)
+    )
+
+
+def run_job(job_id: int):
+    with SessionLocal() as db:
+        # claim the job, so it is never processed twice
+        claimed = db.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .where(Job.status.in_(("queued", "interrupted")))
+            .values(status="running", error=None)
+            .returning(Job.id)
+        ).first()
+        db.commit()
+        if claimed is None:
+            return
+        job = db.get(Job, job_id)
+        items = job.payload
+        try:
+            while job.processed < job.total:
+                db.refresh(job, ["status"])
+                if job.status == "cancelled":
+                    return
+                if stopping.is_set():
+                    finish(db, job_id, status="interrupted")
+                    return
+                chunk = items[job.processed : job.processed + job.chunk_size]
+                insert_chunk(db, job, chunk)
+                job.processed += len(chunk)
+                db.commit()
+                response_cache.invalidate(job.project_id)
+                broker.publish(job.project_id)
+            finish(db, job_id, status="done", result=dict(inserted=job.processed))
+        except Exception as error:
+            db.rollback()
+            finish(db, job_id, status="failed", error=str(error))
+
+
+def finish(db: Session, job_id: int, **values):
+    # a cancel arriving during the last chunk is kept
+    db.execute(
+        update(Job)
+        .where(Job.id == job_id)
+        .where(Job.status == "running")
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def submit(job_id: int):
+    executor.submit(run_job, job_id)
+
+
+def resumable(job: Job) -> bool:
+    if job.status in ("failed", "cancelled", "interrupted"):
+        return True
+    stale = datetime.now(timezone.utc) - JOB_STALE_AFTER
+    return job.status == "running" and job.updated_at < stale
+
+
+def resume_interrupted():
+    # pick up jobs left behind by a stopped or crashed worker
+    stale = datetime.now(timezone.utc) - JOB_STALE_AFTER
+    with SessionLocal() as db:
+        job_ids = db.scalars(
+            select(Job.id).where(
+                or_(
+                    Job.status.in_(("queued", "interrupted")),
+                    (Job.status == "running") & (Job.updated_at < stale),
+                )
+            )
+        ).all()
+        db.execute(
+            update(Job)
+            .where(Job.id.in_(job_ids))
+            .where(Job.status == "running")
+            .values(status="interrupted")
+        )
+        db.commit()
+    for job_id in job_ids:
+        submit(job_id)
+
+
+def shutdown():
+    # running jobs stop after the current chunk and can be resumed later
+    stopping.set()
+    executor.shutdown(wait=True, cancel_futures=True)
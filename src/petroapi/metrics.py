@@ -0,0 +1,157 @@
+import threading
+import time
+from bisect import bisect_left
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.routing import BaseRoute, Match
+
+from petroapi.database import QueryStats, query_stats
+
+router = APIRouter()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: dict[tuple[str, str, int], int] = {}
+        self.in_progress: dict[tuple[str, str], int] = {}
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.statements: dict[tuple[str, str], Histogram] = {}
+        self.db_time: dict[tuple[str, str], Histogram] = {}
+
+    def started(self, key: tuple[str, str]):
+        with self.lock:
+            self.in_progress[key] = self.in_progress.get(key, 0) + 1
+
+    def finished(self, key, status_code, duration, stats: QueryStats):
+        with self.lock:
+            self.in_progress[key] -= 1
+            rkey = (*key, status_code)
+            self.requests[rkey] = self.requests.get(rkey, 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self.statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(
+                stats.statements
+            )
+            self.db_time.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(
+                stats.duration
+            )
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            lines.append("# HELP petroapi_requests_total Total HTTP requests.")
+            lines.append("# TYPE petroapi_requests_total counter")
+            for (method, route, code), value in sorted(self.requests.items()):
+                lines.append(
+                    f'petroapi_requests_total{{method="{method}",route="{route}",'
+                    f'status="{code}"}} {value}'
+                )
+            lines.append(
+                "# HELP petroapi_requests_in_progress HTTP requests in flight."
+            )
+            lines.append("# TYPE petroapi_requests_in_progress gauge")
+            for (method, route), value in sorted(self.in_progress.items()):
+                lines.append(
+                    f'petroapi_requests_in_progress{{method="{method}",'
+                    f'route="{route}"}} {value}'
+                )
+            for name, doc, histograms in (
+                (
+                    "petroapi_request_duration_seconds",
+                    "HTTP request latency.",
+                    self.latency,
+                ),
+                (
+                    "petroapi_db_statements_per_request",
+                    "SQL statements executed per request.",
+                    self.statements,
+                ),
+                (
+                    "petroapi_db_duration_seconds",
+                    "Time spent in SQL statements per request.",
+                    self.db_time,
+                ),
+            ):
+                lines.append(f"# HELP {name} {doc}")
+                lines.append(f"# TYPE {name} histogram")
+                for (method, route), histogram in sorted(histograms.items()):
+                    labels = f'method="{method}",route="{route}"'
+                    lines.extend(histogram.lines(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status_code = 500
+        stats = QueryStats()
+        token = query_stats.set(stats)
+        start = time.perf_counter()
+        key = (scope["method"], route_path(scope))
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.started(key)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            query_stats.reset(token)
+            metrics.finished(key, status_code, time.perf_counter() - start, stats)
+
+
+def match_route(scope) -> tuple[BaseRoute | None, dict]:
+    for route in scope["app"].router.routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return route, child_scope.get("path_params", {})
+    return None, {}
+
+
+def route_path(scope) -> str:
+    # label by route template to keep the number of series bounded
+    route, _ = match_route(scope)
+    return "unmatched" if route is None else route.path
+
+
+@router.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+def get_metrics():
+    return metrics.render()
@@ -1,9 +1,36 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Table
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from datetime import datetime
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+    UniqueConstraint,
+    event,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.orm import (
+    Mapped,
+    Session,
+    mapped_column,
+    relationship,
+    with_loader_criteria,
+)
 
 from petroapi.database import Base
 
+# id of the writing transaction, set on insert and by a trigger on update,
+# see petroapi/revisions.py
+REVISION = text("(pg_current_xact_id()::text::bigint)")
+
 users_projects = Table(
     "users_projects",
     Base.metadata,
@@ -19,6 +46,7 @@ users_projects = Table(
         primary_key=True,
         nullable=False,
     ),
+    Column("revision", BigInteger, nullable=False, server_default=REVISION),
 )
 
 
@@ -29,21 +57,43 @@ class User(Base):
     username: Mapped[str] = mapped_column(String(32), unique=True, index=True)
     email: Mapped[str] = mapped_column(String, nullable=False)
     hashed_password: Mapped[str] = mapped_column(String)
+    membership_version: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0"
+    )
     projects: Mapped[list["Project"]] = relationship(
         secondary=users_projects, back_populates="users"
     )
 
 
+class ApiKey(Base):
+    __tablename__ = "apikeys"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    name: Mapped[str] = mapped_column(String(32), nullable=False)
+    prefix: Mapped[str] = mapped_column(String(16), unique=True, index=True)
+    hashed_key: Mapped[str] = mapped_column(String(64), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    user: Mapped[User] = relationship()
+
+
 class Spot(Base):
     __tablename__ = "spots"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     sample_id: Mapped[int] = mapped_column(
-        ForeignKey("samples.id", ondelete="CASCADE"), nullable=False
+        ForeignKey("samples.id", ondelete="CASCADE"), nullable=False, index=True
     )
     label: Mapped[str] = mapped_column(String(32), nullable=False)
     mineral: Mapped[str | None] = mapped_column(String)
     values: Mapped[dict[str, float]] = mapped_column(JSONB, nullable=False)
+    revision: Mapped[int] = mapped_column(
+        BigInteger, server_default=REVISION, index=True
+    )
     sample: Mapped["Sample"] = relationship(back_populates="spots")
 
 
@@ -52,10 +102,13 @@ class Area(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     sample_id: Mapped[int] = mapped_column(
-        ForeignKey("samples.id", ondelete="CASCADE"), nullable=False
+        ForeignKey("samples.id", ondelete="CASCADE"), nullable=False, index=True
     )
     label: Mapped[str] = mapped_column(String(32), nullable=False)
     values: Mapped[dict[str, float]] = mapped_column(JSONB, nullable=False)
+    revision: Mapped[int] = mapped_column(
+        BigInteger, server_default=REVISION, index=True
+    )
     sample: Mapped["Sample"] = relationship(back_populates="areas")
 
 
@@ -64,24 +117,54 @@ class ProfileSpot(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     profile_id: Mapped[int] = mapped_column(
-        ForeignKey("profiles.id", ondelete="CASCADE"), nullable=False
+        ForeignKey("profiles.id", ondelete="CASCADE"), nullable=False, index=True
     )
     index: Mapped[int] = mapped_column(Integer, nullable=False)
     values: Mapped[dict[str, float]] = mapped_column(JSONB, nullable=False)
+    revision: Mapped[int] = mapped_column(
+        BigInteger, server_default=REVISION, index=True
+    )
     profile: Mapped["Profile"] = relationship(back_populates="spots")
 
 
+class ProfileArray(Base):
+    __tablename__ = "profilearrays"
+
+    # packed profile, one row with a float array per oxide, NaN if missing
+    profile_id: Mapped[int] = mapped_column(
+        ForeignKey("profiles.id", ondelete="CASCADE"), primary_key=True
+    )
+    index: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    oxides: Mapped[list[str]] = mapped_column(ARRAY(String), nullable=False)
+    values: Mapped[list[list[float]]] = mapped_column(
+        ARRAY(Float, dimensions=2), nullable=False
+    )
+    revision: Mapped[int] = mapped_column(
+        BigInteger, server_default=REVISION, index=True
+    )
+    profile: Mapped["Profile"] = relationship(back_populates="arrays")
+
+
 class Profile(Base):
     __tablename__ = "profiles"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     sample_id: Mapped[int] = mapped_column(
-        ForeignKey("samples.id", ondelete="CASCADE"), nullable=False
+        ForeignKey("samples.id", ondelete="CASCADE"), nullable=False, index=True
     )
     label: Mapped[str] = mapped_column(String(32), nullable=False)
     mineral: Mapped[str] = mapped_column(String, nullable=False)
+    packed: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
+    # incremented on every change of the profile spots
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    revision: Mapped[int] = mapped_column(
+        BigInteger, server_default=REVISION, index=True
+    )
     spots: Mapped[list[ProfileSpot]] = relationship(
-        back_populates="profile", cascade="all, delete"
+        back_populates="profile", cascade="all, delete", passive_deletes=True
+    )
+    arrays: Mapped[ProfileArray | None] = relationship(
+        back_populates="profile", cascade="all, delete", passive_deletes=True
     )
     sample: Mapped["Sample"] = relationship(back_populates="profiles")
 
@@ -91,18 +174,24 @@ class Sample(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     project_id: Mapped[int] = mapped_column(
-        ForeignKey("projects.id", ondelete="CASCADE")
+        ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True
     )
     name: Mapped[str] = mapped_column(String(32), nullable=False)
     description: Mapped[str] = mapped_column(String)
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    # incremented on every change of the sample spots
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    revision: Mapped[int] = mapped_column(
+        BigInteger, server_default=REVISION, index=True
+    )
     spots: Mapped[list[Spot]] = relationship(
-        back_populates="sample", cascade="all, delete"
+        back_populates="sample", cascade="all, delete", passive_deletes=True
     )
     areas: Mapped[list[Area]] = relationship(
-        back_populates="sample", cascade="all, delete"
+        back_populates="sample", cascade="all, delete", passive_deletes=True
     )
     profiles: Mapped[list[Profile]] = relationship(
-        back_populates="sample", cascade="all, delete"
+        back_populates="sample", cascade="all, delete", passive_deletes=True
     )
     project: Mapped["Project"] = relationship(back_populates="samples")
 
@@ -113,10 +202,122 @@ class Project(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(32), nullable=False)
     description: Mapped[str] = mapped_column(String)
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    revision: Mapped[int] = mapped_column(
+        BigInteger, server_default=REVISION, index=True
+    )
     samples: Mapped[list[Sample]] = relationship(
-        back_populates="project", cascade="all, delete"
+        back_populates="project", cascade="all, delete", passive_deletes=True
     )
     users: Mapped[list[User]] = relationship(
         secondary=users_projects,
         back_populates="projects",
+        passive_deletes=True,
     )
+
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+
+    # written by a trigger for every deleted row, read by the change feed
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    revision: Mapped[int] = mapped_column(
+        BigInteger, server_default=REVISION, index=True
+    )
+    # no foreign keys, the tombstone outlives the deleted row
+    entity: Mapped[str] = mapped_column(String(16), nullable=False)
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    project_id: Mapped[int | None] = mapped_column(Integer, index=True)
+    # set for removed project memberships
+    user_id: Mapped[int | None] = mapped_column(Integer)
+    deleted_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    project_id: Mapped[int] = mapped_column(
+        ForeignKey("projects.id", ondelete="CASCADE"), nullable=False
+    )
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    # sample or profile receiving the imported rows
+    parent_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, index=True)
+    total: Mapped[int] = mapped_column(Integer, nullable=False)
+    processed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    chunk_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    error: Mapped[str | None] = mapped_column(String)
+    payload: Mapped[list[dict]] = mapped_column(JSONB, nullable=False, deferred=True)
+    result: Mapped[dict | None] = mapped_column(JSONB)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class Purge(Base):
+    __tablename__ = "purges"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # no foreign keys, the purge outlives the purged project or sample
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    target_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, index=True)
+    deleted_rows: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[str | None] = mapped_column(String)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotencykeys"
+    __table_args__ = (UniqueConstraint("owner", "key"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # user id or hash of the API key, keys of different clients never clash
+    owner: Mapped[str] = mapped_column(String(64), nullable=False)
+    key: Mapped[str] = mapped_column(String(255), nullable=False)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    # response, status is NULL while the request is running
+    status_code: Mapped[int | None] = mapped_column(Integer)
+    content_type: Mapped[str | None] = mapped_column(String)
+    # zlib compressed, NULL if the response was too large to keep
+    body: Mapped[bytes | None] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def hide_deleted(execute_state):
+    # soft deleted projects and samples are invisible to every ORM query,
+    # pass execution_options(include_deleted=True) to see them
+    if execute_state.is_select and not execute_state.execution_options.get(
+        "include_deleted", False
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(
+                Project, Project.deleted_at.is_(None), include_aliases=True
+            ),
+            with_loader_criteria(
+                Sample, Sample.deleted_at.is_(None), include_aliases=True
+            ),
+        )
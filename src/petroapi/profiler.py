@@ -0,0 +1,101 @@
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from petroapi.database import QueryStats, engine, query_stats
+
+_ = load_dotenv()
+# fraction of requests profiled, 1 profiles every request (development)
+PROFILE_SQL_RATE = float(os.environ.get("PROFILE_SQL_RATE", 0))
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+PROFILE_EXPLAIN = os.environ.get("PROFILE_EXPLAIN", "").lower() in ("1", "true")
+# same statement shape repeated this many times is reported as likely N+1
+N_PLUS_ONE_THRESHOLD = 5
+# number of slowest statements explained for a slow request
+EXPLAIN_LIMIT = 3
+
+logger = logging.getLogger("petroapi.profiler")
+
+_param_list = re.compile(r"\(\s*%\(\w+\)s(?:\s*,\s*%\(\w+\)s)*\s*\)")
+_number = re.compile(r"\b\d+\b")
+_space = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    shape = _param_list.sub("(?)", statement)
+    shape = _number.sub("?", shape)
+    return _space.sub(" ", shape).strip()
+
+
+def find_repeated(
+    queries: list[tuple[str, object, float]], threshold: int = N_PLUS_ONE_THRESHOLD
+) -> list[tuple[str, int]]:
+    shapes = Counter(statement_shape(statement) for statement, _, _ in queries)
+    return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+
+def explain(statement: str, parameters) -> str:
+    with engine.connect() as conn:
+        try:
+            rows = conn.exec_driver_sql(
+                f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+            )
+            return "\n".join(row[0] for row in rows)
+        finally:
+            conn.rollback()
+
+
+def report(method: str, path: str, duration: float, stats: QueryStats):
+    queries = stats.queries or []
+    for shape, n in find_repeated(queries):
+        logger.warning("%s %s: likely N+1, %d x %s", method, path, n, shape)
+    if duration * 1000 < SLOW_REQUEST_MS:
+        return
+    lines = [
+        f"{method} {path}: slow request {duration * 1000:.1f} ms, "
+        f"{stats.statements} statements in {stats.duration * 1000:.1f} ms"
+    ]
+    for statement, parameters, elapsed in queries:
+        lines.append(f"  {elapsed * 1000:8.2f} ms  {_space.sub(' ', statement)}")
+    if PROFILE_EXPLAIN:
+        slowest = sorted(queries, key=lambda query: query[2], reverse=True)
+        for statement, parameters, elapsed in slowest[:EXPLAIN_LIMIT]:
+            if not statement.lstrip().upper().startswith("SELECT"):
+                continue
+            lines.append(f"  EXPLAIN {_space.sub(' ', statement)}")
+            try:
+                lines.append(explain(statement, parameters))
+            except Exception as error:
+                lines.append(f"  failed: {error}")
+    logger.warning("\n".join(lines))
+
+
+class ProfilerMiddleware:
+    # must run inside MetricsMiddleware, which provides the QueryStats
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        stats = query_stats.get()
+        if (
+            scope["type"] != "http"
+            or stats is None
+            or PROFILE_SQL_RATE <= 0
+            or random.random() >= PROFILE_SQL_RATE
+        ):
+            return await self.app(scope, receive, send)
+        stats.queries = []
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration = time.perf_counter() - start
+            await run_in_threadpool(
+                report, scope["method"], scope["path"], duration, stats
+            )
@@ -0,0 +1,119 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, or_, select, update
+
+from petroapi.database import engine
+from petroapi.models import Area, Profile, ProfileSpot, Project, Purge, Sample, Spot
+
+_ = load_dotenv()
+# rows deleted per transaction and pause between transactions, keeps locks
+# short and lets autovacuum and replication keep up
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", 10000))
+PURGE_PAUSE_SECONDS = float(os.environ.get("PURGE_PAUSE_SECONDS", 0.1))
+# running purge without progress for this long is considered dead
+PURGE_STALE_AFTER = timedelta(minutes=10)
+
+# one purge at a time, purging is throttled on purpose
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="purge")
+stopping = threading.Event()
+
+
+class Interrupted(Exception):
+    pass
+
+
+def delete_batches(purge_id: int, model, where) -> int:
+    deleted = 0
+    while True:
+        if stopping.is_set():
+            raise Interrupted
+        batch = select(model.id).where(where).limit(PURGE_BATCH_SIZE)
+        with engine.begin() as conn:
+            n = conn.execute(delete(model).where(model.id.in_(batch))).rowcount
+            conn.execute(
+                update(Purge)
+                .where(Purge.id == purge_id)
+                .values(deleted_rows=Purge.deleted_rows + n)
+            )
+        deleted += n
+        if n < PURGE_BATCH_SIZE:
+            return deleted
+        stopping.wait(PURGE_PAUSE_SECONDS)
+
+
+def purge_sample(purge_id: int, sample_id: int):
+    profiles = select(Profile.id).where(Profile.sample_id == sample_id)
+    delete_batches(purge_id, ProfileSpot, ProfileSpot.profile_id.in_(profiles))
+    delete_batches(purge_id, Spot, Spot.sample_id == sample_id)
+    delete_batches(purge_id, Area, Area.sample_id == sample_id)
+    delete_batches(purge_id, Profile, Profile.sample_id == sample_id)
+    delete_batches(purge_id, Sample, Sample.id == sample_id)
+
+
+def purge_project(purge_id: int, project_id: int):
+    with engine.connect() as conn:
+        sample_ids = conn.scalars(
+            select(Sample.id).where(Sample.project_id == project_id)
+        ).all()
+    for sample_id in sample_ids:
+        purge_sample(purge_id, sample_id)
+    delete_batches(purge_id, Project, Project.id == project_id)
+
+
+def run_purge(purge_id: int):
+    with engine.begin() as conn:
+        purge = conn.execute(
+            update(Purge)
+            .where(Purge.id == purge_id)
+            .where(Purge.status.in_(("queued", "interrupted")))
+            .values(status="running", error=None)
+            .returning(Purge.kind, Purge.target_id)
+        ).first()
+    if purge is None:
+        return
+    try:
+        if purge.kind == "project":
+            purge_project(purge_id, purge.target_id)
+        else:
+            purge_sample(purge_id, purge.target_id)
+        status, error = "done", None
+    except Interrupted:
+        status, error = "interrupted", None
+    except Exception as exc:
+        status, error = "failed", str(exc)
+    with engine.begin() as conn:
+        conn.execute(
+            update(Purge).where(Purge.id == purge_id).values(status=status, error=error)
+        )
+
+
+def submit(purge_id: int):
+    executor.submit(run_purge, purge_id)
+
+
+def resume_purges():
+    # deletes are idempotent, so unfinished purges simply start over
+    stale = datetime.now(timezone.utc) - PURGE_STALE_AFTER
+    with engine.begin() as conn:
+        purge_ids = conn.scalars(
+            update(Purge)
+            .where(
+                or_(
+                    Purge.status.in_(("queued", "interrupted")),
+                    (Purge.status == "running") & (Purge.updated_at < stale),
+                )
+            )
+            .values(status="queued")
+            .returning(Purge.id)
+        ).all()
+    for purge_id in purge_ids:
+        submit(purge_id)
+
+
+def shutdown():
+    stopping.set()
+    executor.shutdown(wait=True, cancel_futures=True)
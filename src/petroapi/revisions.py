@@ -0,0 +1,351 @@
+import math
+
+from sqlalchemy import BigInteger, Text, func, inspect, or_, select
+
+from petroapi.models import (
+    Area,
+    Profile,
+    ProfileArray,
+    ProfileSpot,
+    Project,
+    Sample,
+    Spot,
+    Tombstone,
+    users_projects,
+)
+
+# bump when the functions or triggers below change, they are reinstalled
+REVISIONS_DDL_VERSION = 2
+REVISION_DEFAULT = "(pg_current_xact_id()::text::bigint)"
+REVISION_TABLES = [
+    "projects",
+    "samples",
+    "spots",
+    "areas",
+    "profiles",
+    "profilespots",
+    "profilearrays",
+]
+# tables whose version counts changes of their children, an update of the
+# version alone is not a change of the row itself
+VERSIONED_TABLES = {"samples", "profiles"}
+
+SAMPLE = "JOIN samples s ON s.id = o.sample_id AND s.deleted_at IS NULL"
+PROFILE = (
+    "JOIN profiles f ON f.id = o.profile_id "
+    "JOIN samples s ON s.id = f.sample_id AND s.deleted_at IS NULL"
+)
+PROJECT = "JOIN projects p ON p.id = s.project_id AND p.deleted_at IS NULL"
+
+# table -> (entity, key, project id, joins) of the changed rows o. Rows whose
+# parent is deleted or soft deleted are dropped by the joins, the change of
+# the parent covers them, so purges and cascades write one tombstone
+# instead of millions.
+ROWS = {
+    "projects": ("project", "o.id", "o.id", ""),
+    "samples": (
+        "sample",
+        "o.id",
+        "o.project_id",
+        "JOIN projects p ON p.id = o.project_id AND p.deleted_at IS NULL",
+    ),
+    "spots": ("spot", "o.id", "s.project_id", f"{SAMPLE} {PROJECT}"),
+    "areas": ("area", "o.id", "s.project_id", f"{SAMPLE} {PROJECT}"),
+    "profiles": ("profile", "o.id", "s.project_id", f"{SAMPLE} {PROJECT}"),
+    "profilespots": ("profilespot", "o.id", "s.project_id", f"{PROFILE} {PROJECT}"),
+    "profilearrays": (
+        "profilearray",
+        "o.profile_id",
+        "s.project_id",
+        f"{PROFILE} {PROJECT}",
+    ),
+}
+
+# table -> tombstones of the deleted rows in old_rows
+TOMBSTONES = {
+    table: f"SELECT '{entity}', {key}, {project}, NULL FROM old_rows o {joins}"
+    for table, (entity, key, project, joins) in ROWS.items()
+}
+# visible to the removed user only, the project id is the entity id
+TOMBSTONES["users_projects"] = (
+    "SELECT 'membership', o.project_id, NULL, o.user_id FROM old_rows o"
+)
+
+# entity -> (model, key, project id, joins), rank is the position, soft
+# deleted samples are hidden from the joins by the ORM
+ENTITIES = {
+    "project": (Project, Project.id, Project.id, []),
+    "sample": (Sample, Sample.id, Sample.project_id, []),
+    "spot": (Spot, Spot.id, Sample.project_id, [(Sample, Spot.sample_id)]),
+    "area": (Area, Area.id, Sample.project_id, [(Sample, Area.sample_id)]),
+    "profile": (Profile, Profile.id, Sample.project_id, [(Sample, Profile.sample_id)]),
+    "profilespot": (
+        ProfileSpot,
+        ProfileSpot.id,
+        Sample.project_id,
+        [(Profile, ProfileSpot.profile_id), (Sample, Profile.sample_id)],
+    ),
+    "profilearray": (
+        ProfileArray,
+        ProfileArray.profile_id,
+        Sample.project_id,
+        [(Profile, ProfileArray.profile_id), (Sample, Profile.sample_id)],
+    ),
+}
+MEMBERSHIP_RANK = len(ENTITIES)
+TOMBSTONE_RANK = MEMBERSHIP_RANK + 1
+
+# revision, rank of the entity and id of the last change read
+Cursor = tuple[int, int, int]
+
+
+class RevisionError(ValueError):
+    pass
+
+
+# ---------------------------------- SCHEMA
+
+
+def ddl() -> list[str]:
+    statements = [
+        "CREATE OR REPLACE FUNCTION petroapi_revision() RETURNS trigger AS $$ "
+        f"BEGIN NEW.revision := {REVISION_DEFAULT}; RETURN NEW; END "
+        "$$ LANGUAGE plpgsql",
+        f"COMMENT ON FUNCTION petroapi_revision() IS '{REVISIONS_DDL_VERSION}'",
+    ]
+    for table in REVISION_TABLES:
+        when = ""
+        if table in VERSIONED_TABLES:
+            when = (
+                "WHEN ((to_jsonb(NEW) - 'version' - 'revision') "
+                "IS DISTINCT FROM (to_jsonb(OLD) - 'version' - 'revision')) "
+            )
+        # existing rows get revision 0, new ones the writing transaction
+        statements += [
+            f"ALTER TABLE {table} "
+            "ADD COLUMN IF NOT EXISTS revision bigint NOT NULL DEFAULT 0",
+            f"ALTER TABLE {table} ALTER COLUMN revision SET DEFAULT {REVISION_DEFAULT}",
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_revision ON {table} (revision)",
+            f"DROP TRIGGER IF EXISTS petroapi_revision ON {table}",
+            f"CREATE TRIGGER petroapi_revision BEFORE UPDATE ON {table} "
+            f"FOR EACH ROW {when}EXECUTE FUNCTION petroapi_revision()",
+        ]
+    statements += [
+        "ALTER TABLE users_projects "
+        "ADD COLUMN IF NOT EXISTS revision bigint NOT NULL DEFAULT 0",
+        "ALTER TABLE users_projects "
+        f"ALTER COLUMN revision SET DEFAULT {REVISION_DEFAULT}",
+    ]
+    for table, rows in TOMBSTONES.items():
+        # statement level, one INSERT per DELETE however many rows it removes
+        statements += [
+            f"CREATE OR REPLACE FUNCTION petroapi_tombstone_{table}() "
+            "RETURNS trigger AS $$ BEGIN "
+            "INSERT INTO tombstones (entity, entity_id, project_id, user_id) "
+            f"{rows}; RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"DROP TRIGGER IF EXISTS petroapi_tombstone ON {table}",
+            f"CREATE TRIGGER petroapi_tombstone AFTER DELETE ON {table} "
+            "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT "
+            f"EXECUTE FUNCTION petroapi_tombstone_{table}()",
+        ]
+    return statements
+
+
+def installed(conn, function: str, version: int) -> bool:
+    # the version is kept in the comment of a trigger function
+    comment = conn.exec_driver_sql(
+        f"SELECT obj_description(to_regproc('{function}'), 'pg_proc')"
+    ).scalar()
+    return comment == str(version)
+
+
+def install(conn):
+    # runs under the init lock, skipped when up to date, so worker starts
+    # do not take table locks
+    if installed(conn, "petroapi_revision", REVISIONS_DDL_VERSION):
+        return
+    for statement in ddl():
+        conn.exec_driver_sql(statement)
+
+
+# ---------------------------------- FEED
+
+
+def parse_cursor(value: str) -> Cursor:
+    try:
+        parts = [int(part) for part in value.split(".")]
+    except ValueError:
+        raise RevisionError(f"Invalid cursor {value!r}")
+    if len(parts) == 1:
+        # plain revision, everything written from that revision on
+        return parts[0], -1, 0
+    if len(parts) != 3:
+        raise RevisionError(f"Invalid cursor {value!r}")
+    return parts[0], parts[1], parts[2]
+
+
+def format_cursor(cursor: Cursor) -> str:
+    return ".".join(str(part) for part in cursor)
+
+
+def horizon(db) -> int:
+    # oldest transaction still running, everything below is committed or
+    # aborted for good, so a later read cannot add changes before it
+    xmin = func.pg_snapshot_xmin(func.pg_current_snapshot())
+    return db.scalar(select(xmin.cast(Text).cast(BigInteger)))
+
+
+def after(revision_column, key, rank: int, cursor: Cursor, upto: int) -> list:
+    # (revision, rank, key) > cursor, split so the revision index is used
+    revision, last_rank, last_key = cursor
+    conditions = [revision_column >= revision, revision_column < upto]
+    if rank == last_rank:
+        conditions.append(or_(revision_column > revision, key > last_key))
+    elif rank < last_rank:
+        conditions.append(revision_column > revision)
+    return conditions
+
+
+def row_data(obj) -> dict:
+    data = {
+        attr.key: getattr(obj, attr.key)
+        for attr in inspect(obj).mapper.column_attrs
+        if attr.key not in ("revision", "deleted_at", "version")
+    }
+    if isinstance(obj, ProfileArray):
+        # NaN is not valid JSON
+        data["values"] = [
+            [None if math.isnan(v) else v for v in row] for row in data["values"]
+        ]
+    return data
+
+
+def entity_changes(db, projects, cursor: Cursor, upto: int, limit: int) -> list:
+    # one list of changes per entity
+    sources = []
+    for rank, (entity, (model, key, project, joins)) in enumerate(ENTITIES.items()):
+        statement = select(model, project.label("project_id"))
+        for target, column in joins:
+            statement = statement.join(target, column == target.id)
+        statement = (
+            statement.where(project.in_(projects))
+            .where(*after(model.revision, key, rank, cursor, upto))
+            .order_by(model.revision, key)
+            .limit(limit)
+        )
+        if model in (Project, Sample):
+            # soft deleted projects and samples are reported as deleted
+            statement = statement.execution_options(include_deleted=True)
+        changes = []
+        for obj, project_id in db.execute(statement):
+            deleted = getattr(obj, "deleted_at", None) is not None
+            changes.append(
+                (
+                    (obj.revision, rank, getattr(obj, key.key)),
+                    dict(
+                        entity=entity,
+                        id=getattr(obj, key.key),
+                        action="delete" if deleted else "upsert",
+                        revision=obj.revision,
+                        project_id=project_id,
+                        data=None if deleted else row_data(obj),
+                    ),
+                )
+            )
+        sources.append(changes)
+    return sources
+
+
+def membership_changes(db, user_id, project_id, cursor, upto, limit) -> list:
+    statement = (
+        select(users_projects.c.project_id, users_projects.c.revision)
+        .where(users_projects.c.user_id == user_id)
+        .where(
+            *after(
+                users_projects.c.revision,
+                users_projects.c.project_id,
+                MEMBERSHIP_RANK,
+                cursor,
+                upto,
+            )
+        )
+        .order_by(users_projects.c.revision, users_projects.c.project_id)
+        .limit(limit)
+    )
+    if project_id is not None:
+        statement = statement.where(users_projects.c.project_id == project_id)
+    return [
+        (
+            (row.revision, MEMBERSHIP_RANK, row.project_id),
+            dict(
+                entity="membership",
+                id=row.project_id,
+                action="upsert",
+                revision=row.revision,
+                project_id=row.project_id,
+                data=None,
+            ),
+        )
+        for row in db.execute(statement)
+    ]
+
+
+def tombstone_changes(db, user_id, projects, project_id, cursor, upto, limit):
+    memberships = Tombstone.user_id == user_id
+    if project_id is not None:
+        memberships &= Tombstone.entity_id == project_id
+    statement = (
+        select(Tombstone)
+        .where(or_(Tombstone.project_id.in_(projects), memberships))
+        .where(*after(Tombstone.revision, Tombstone.id, TOMBSTONE_RANK, cursor, upto))
+        .order_by(Tombstone.revision, Tombstone.id)
+        .limit(limit)
+    )
+    return [
+        (
+            (tombstone.revision, TOMBSTONE_RANK, tombstone.id),
+            dict(
+                entity=tombstone.entity,
+                id=tombstone.entity_id,
+                action="delete",
+                revision=tombstone.revision,
+                project_id=tombstone.project_id or tombstone.entity_id,
+                data=None,
+            ),
+        )
+        for tombstone in db.scalars(statement)
+    ]
+
+
+def read_changes(db, user_id: int, projects, project_id, cursor: Cursor, limit: int):
+    # each source is read up to the limit in cursor order. A source that hit
+    # the limit may have more changes after its last one, so the merged page
+    # is only complete up to the smallest of those last changes.
+    upto = horizon(db)
+    if project_id is not None:
+        projects = [project_id]
+    sources = entity_changes(db, projects, cursor, upto, limit)
+    sources.append(membership_changes(db, user_id, project_id, cursor, upto, limit))
+    sources.append(
+        tombstone_changes(db, user_id, projects, project_id, cursor, upto, limit)
+    )
+    saturated = [changes[-1][0] for changes in sources if len(changes) >= limit]
+    changes = sorted(
+        (change for changes in sources for change in changes),
+        key=lambda change: change[0],
+    )
+    if saturated:
+        changes = [change for change in changes if change[0] <= min(saturated)]
+    if saturated or len(changes) > limit:
+        changes = changes[:limit]
+        return dict(
+            cursor=format_cursor(changes[-1][0]),
+            more=True,
+            changes=[change for _, change in changes],
+        )
+    # everything before the horizon was read, continue from there
+    return dict(
+        cursor=format_cursor(max(cursor, (upto, -1, 0))),
+        more=False,
+        changes=[change for _, change in changes],
+    )
@@ -0,0 +1,77 @@
+# controllers/customer_controller.py
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from petroapi.auth import (
+    TokenUser,
+    generate_api_key,
+    get_api_key_hash,
+    get_current_user,
+)
+from petroapi.database import get_db
+from petroapi.models import ApiKey
+from petroapi.schema import ApiKeyCreatedSchema, ApiKeyCreateSchema, ApiKeySchema
+
+router = APIRouter()
+
+# ---------------------------------- API KEY
+
+
+# CREATE API key
+@router.post("/apikey/", response_model=ApiKeyCreatedSchema)
+def create_apikey(
+    apikey: ApiKeyCreateSchema,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    if db.query(ApiKey).filter_by(user_id=user.id).filter_by(name=apikey.name).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="API key with same name already exists",
+        )
+    prefix, key = generate_api_key()
+    new_apikey = ApiKey(
+        user_id=user.id,
+        name=apikey.name,
+        prefix=prefix,
+        hashed_key=get_api_key_hash(key),
+    )
+    db.add(new_apikey)
+    db.commit()
+    db.refresh(new_apikey)
+    # the plain key is returned only once
+    return ApiKeyCreatedSchema(
+        id=new_apikey.id,
+        name=new_apikey.name,
+        prefix=new_apikey.prefix,
+        created_at=new_apikey.created_at,
+        key=key,
+    )
+
+
+# READ All API keys
+@router.get("/apikeys/", response_model=list[ApiKeySchema])
+def get_apikeys(
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    return db.query(ApiKey).filter_by(user_id=user.id)
+
+
+# DELETE API key
+@router.delete("/apikey/{apikey_id}", response_model=dict[str, str])
+def delete_apikey(
+    apikey_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    apikey = db.query(ApiKey).filter_by(user_id=user.id).filter_by(id=apikey_id).first()
+    if apikey is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="API key not found"
+        )
+    db.delete(apikey)
+    db.commit()
+    return dict(message="API key revoked successfully")
@@ -1,13 +1,25 @@
 # controllers/customer_controller.py
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
-from petroapi.auth import get_current_user
-from petroapi.database import get_db
-from petroapi.models import Area, Project, Sample, User
-from petroapi.schema import AreaCreateSchema, AreaSchema
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.bulk import (
+    BulkError,
+    delete_filtered,
+    scaled_values,
+    update_filtered,
+    update_items,
+)
+from petroapi.database import get_db, get_read_db
+from petroapi.models import Area, Project, Sample
+from petroapi.schema import (
+    AreaBulkUpdateSchema,
+    AreaCreateSchema,
+    AreaSchema,
+    BulkDeleteSchema,
+)
 
 router = APIRouter()
 
@@ -20,12 +32,12 @@ def create_area(
     project_id: int,
     sample_id: int,
     area: AreaCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -67,12 +79,12 @@ def create_areas(
     project_id: int,
     sample_id: int,
     areas: list[AreaCreateSchema],
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -118,12 +130,12 @@ def create_areas(
 def get_areas(
     project_id: int,
     sample_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -155,12 +167,12 @@ def get_area(
     project_id: int,
     sample_id: int,
     area_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -193,12 +205,12 @@ def update_area(
     sample_id: int,
     area_id: int,
     area_update: AreaCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -229,6 +241,57 @@ def update_area(
     return area
 
 
+# UPDATE Sample Areas
+@router.patch("/areas/{project_id}/{sample_id}", response_model=dict[str, int])
+def update_areas(
+    project_id: int,
+    sample_id: int,
+    areas_update: AreaBulkUpdateSchema,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    try:
+        updated = update_items(
+            db,
+            Area,
+            Area.sample_id,
+            sample_id,
+            [item.dict(exclude_unset=True) for item in areas_update.items],
+        )
+        if areas_update.filter is not None:
+            changes = {}
+            if areas_update.scale:
+                changes["values"] = scaled_values(Area, areas_update.scale)
+            updated += update_filtered(
+                db, Area, Area.sample_id, sample_id, areas_update.filter, changes
+            )
+    except BulkError as error:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    db.commit()
+    return dict(updated=updated)
+
+
 # DELETE Sample Area
 @router.delete(
     "/area/{project_id}/{sample_id}/{area_id}", response_model=dict[str, str]
@@ -237,12 +300,12 @@ def delete_area(
     project_id: int,
     sample_id: int,
     area_id: int,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -268,3 +331,44 @@ def delete_area(
     db.delete(area)
     db.commit()
     return dict(message="Area deleted successfully")
+
+
+# DELETE Sample Areas
+@router.delete("/areas/{project_id}/{sample_id}", response_model=dict[str, int])
+def delete_areas(
+    project_id: int,
+    sample_id: int,
+    criteria: Annotated[BulkDeleteSchema, Query()],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    try:
+        deleted = delete_filtered(
+            db, Area, Area.sample_id, sample_id, criteria, dry_run=criteria.dry_run
+        )
+    except BulkError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    if criteria.dry_run:
+        return dict(matched=deleted)
+    db.commit()
+    return dict(deleted=deleted)
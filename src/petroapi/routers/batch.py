@@ -0,0 +1,42 @@
+# controllers/customer_controller.py
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.batch import BatchError, run
+from petroapi.database import get_db
+from petroapi.models import Project
+from petroapi.schema import BatchResultSchema, BatchSchema
+
+router = APIRouter()
+
+# ---------------------------------- BATCH
+
+
+# RUN Batch of operations in one transaction
+@router.post("/batch/{project_id}", response_model=list[BatchResultSchema])
+def run_batch(
+    project_id: int,
+    batch: BatchSchema,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    try:
+        results = run(db, project, batch.operations)
+    except BatchError as error:
+        db.rollback()
+        raise HTTPException(status_code=error.status_code, detail=str(error))
+    db.commit()
+    return results
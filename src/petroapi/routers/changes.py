@@ -0,0 +1,34 @@
+# controllers/customer_controller.py
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_read_db
+from petroapi.revisions import RevisionError, parse_cursor, read_changes
+from petroapi.schema import ChangesSchema
+
+router = APIRouter()
+
+# ---------------------------------- CHANGES
+
+
+# READ Changes since cursor
+@router.get("/changes/", response_model=ChangesSchema)
+def get_changes(
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
+    since: str = "0",
+    limit: Annotated[int, Query(ge=1, le=10000)] = 1000,
+    project_id: int | None = None,
+):
+    if project_id is not None and project_id not in user.projects:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    try:
+        cursor = parse_cursor(since)
+    except RevisionError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    return read_changes(db, user.id, user.projects, project_id, cursor, limit)
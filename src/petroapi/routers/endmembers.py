@@ -0,0 +1,102 @@
+# controllers/customer_controller.py
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_read_db
+from petroapi.endmembers import profile_endmembers, sample_endmembers
+from petroapi.models import Profile, Project, Sample
+from petroapi.series import SeriesError
+
+router = APIRouter()
+
+# ---------------------------------- END-MEMBERS
+
+
+# READ Sample Spots End-member Fractions
+@router.get(
+    "/endmembers/spots/{project_id}/{sample_id}",
+    response_model=dict[str, list[int | float | str | None]],
+)
+def get_spots_endmembers(
+    project_id: int,
+    sample_id: int,
+    mineral: str,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    try:
+        return sample_endmembers(db, sample, mineral)
+    except SeriesError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+
+# READ Sample Profile End-member Fractions
+@router.get(
+    "/endmembers/profile/{project_id}/{sample_id}/{profile_id}",
+    response_model=dict[str, list[int | float | None]],
+)
+def get_profile_endmembers(
+    project_id: int,
+    sample_id: int,
+    profile_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
+    mineral: str | None = None,
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    profile = (
+        db.query(Profile)
+        .filter_by(sample_id=sample_id)
+        .filter_by(id=profile_id)
+        .first()
+    )
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    try:
+        return profile_endmembers(db, profile, mineral)
+    except SeriesError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
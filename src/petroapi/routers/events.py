@@ -0,0 +1,79 @@
+# controllers/customer_controller.py
+import asyncio
+import json
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import SessionLocal
+from petroapi.events import hub
+from petroapi.models import Project, users_projects
+
+router = APIRouter()
+
+# comment lines sent while idle, keep proxies from closing the stream
+KEEPALIVE_SECONDS = 15
+# membership is rechecked this often, the stream ends when access is gone
+ACCESS_CHECK_SECONDS = KEEPALIVE_SECONDS
+
+
+def project_member(user_id: int, project_id: int) -> bool:
+    # soft deleted projects are hidden by the ORM
+    with SessionLocal() as db:
+        return (
+            db.query(Project.id)
+            .join(users_projects, users_projects.c.project_id == Project.id)
+            .where(users_projects.c.user_id == user_id)
+            .filter(Project.id == project_id)
+            .first()
+            is not None
+        )
+
+
+# ---------------------------------- EVENTS
+
+
+# STREAM Project change events
+@router.get("/events/{project_id}", response_class=StreamingResponse)
+async def get_events(
+    project_id: int,
+    request: Request,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+):
+    if project_id not in user.projects:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    subscriber = hub.subscribe(project_id)
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        checked = loop.time()
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                if loop.time() - checked >= ACCESS_CHECK_SECONDS:
+                    if not await run_in_threadpool(project_member, user.id, project_id):
+                        # removed from the project or project deleted
+                        yield "event: revoked\ndata: {}\n\n"
+                        return
+                    checked = loop.time()
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber[1].get(), KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: change\ndata: {json.dumps(event)}\n\n"
+        finally:
+            hub.unsubscribe(project_id, subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,298 @@
+# controllers/customer_controller.py
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_db
+from petroapi.jobs import JOB_CHUNK_SIZE, resumable, submit
+from petroapi.models import Job, Profile, Project, Sample
+from petroapi.schema import (
+    AreaCreateSchema,
+    JobSchema,
+    ProfileSpotCreateSchema,
+    SpotCreateSchema,
+)
+
+router = APIRouter()
+
+# ---------------------------------- JOB
+
+
+def create_job(
+    db: Session,
+    user: TokenUser,
+    project_id: int,
+    kind: str,
+    parent_id: int,
+    items: list[dict[str, Any]],
+    unique: str,
+) -> Job:
+    keys = {item[unique] for item in items}
+    if len(keys) != len(items):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Duplicate {unique} in uploaded items",
+        )
+    job = Job(
+        user_id=user.id,
+        project_id=project_id,
+        kind=kind,
+        parent_id=parent_id,
+        status="queued",
+        total=len(items),
+        processed=0,
+        chunk_size=JOB_CHUNK_SIZE,
+        payload=items,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    submit(job.id)
+    return job
+
+
+# IMPORT Sample Spots
+@router.post(
+    "/job/spots/{project_id}/{sample_id}",
+    response_model=JobSchema,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def import_spots(
+    project_id: int,
+    sample_id: int,
+    spots: list[SpotCreateSchema],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    items = [spot.model_dump() for spot in spots]
+    return create_job(db, user, project_id, "spots", sample_id, items, "label")
+
+
+# IMPORT Sample Areas
+@router.post(
+    "/job/areas/{project_id}/{sample_id}",
+    response_model=JobSchema,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def import_areas(
+    project_id: int,
+    sample_id: int,
+    areas: list[AreaCreateSchema],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    items = [area.model_dump() for area in areas]
+    return create_job(db, user, project_id, "areas", sample_id, items, "label")
+
+
+# IMPORT Sample Profile Spots
+@router.post(
+    "/job/profilespots/{project_id}/{sample_id}/{profile_id}",
+    response_model=JobSchema,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def import_profilespots(
+    project_id: int,
+    sample_id: int,
+    profile_id: int,
+    profilespots: list[ProfileSpotCreateSchema],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    profile = (
+        db.query(Profile)
+        .filter_by(sample_id=sample_id)
+        .filter_by(id=profile_id)
+        .first()
+    )
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
+    items = [profilespot.model_dump() for profilespot in profilespots]
+    return create_job(db, user, project_id, "profilespots", profile_id, items, "index")
+
+
+# READ All Jobs
+@router.get("/jobs/", response_model=list[JobSchema])
+def get_jobs(
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    return (
+        db.query(Job)
+        .filter_by(user_id=user.id)
+        .where(Job.project_id.in_(user.projects))
+        .order_by(Job.id.desc())
+    )
+
+
+# READ Single Job (progress)
+@router.get("/job/{job_id}", response_model=JobSchema)
+def get_job(
+    job_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    job = (
+        db.query(Job)
+        .filter_by(user_id=user.id)
+        .where(Job.project_id.in_(user.projects))
+        .filter_by(id=job_id)
+        .first()
+    )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    return job
+
+
+# READ Job Result
+@router.get("/job/{job_id}/result", response_model=dict[str, Any])
+def get_job_result(
+    job_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    job = (
+        db.query(Job)
+        .filter_by(user_id=user.id)
+        .where(Job.project_id.in_(user.projects))
+        .filter_by(id=job_id)
+        .first()
+    )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    if job.status == "failed":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job.status}"
+        )
+    return job.result
+
+
+# CANCEL Job
+@router.post("/job/{job_id}/cancel", response_model=JobSchema)
+def cancel_job(
+    job_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    job = (
+        db.query(Job)
+        .filter_by(user_id=user.id)
+        .where(Job.project_id.in_(user.projects))
+        .filter_by(id=job_id)
+        .first()
+    )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    if job.status not in ("queued", "running", "interrupted"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Job is {job.status}"
+        )
+    job.status = "cancelled"
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+# RESUME Job from last committed chunk
+@router.post("/job/{job_id}/resume", response_model=JobSchema)
+def resume_job(
+    job_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    job = (
+        db.query(Job)
+        .filter_by(user_id=user.id)
+        .where(Job.project_id.in_(user.projects))
+        .filter_by(id=job_id)
+        .first()
+    )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    if not resumable(job):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Job is {job.status}"
+        )
+    job.status = "queued"
+    db.commit()
+    db.refresh(job)
+    submit(job.id)
+    return job
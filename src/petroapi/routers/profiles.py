@@ -1,13 +1,27 @@
 # controllers/customer_controller.py
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
-from petroapi.auth import get_current_user
-from petroapi.database import get_db
-from petroapi.models import Profile, Project, Sample, User
-from petroapi.schema import ProfileCreateSchema, ProfileSchema
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_db, get_read_db
+from petroapi.models import Profile, Project, Sample
+from petroapi.schema import (
+    ProfileCreateSchema,
+    ProfileSchema,
+    ResampledProfileSchema,
+    ResampleSchema,
+)
+from petroapi.series import (
+    SeriesError,
+    columns,
+    common_grid,
+    pack,
+    read_series,
+    resample,
+    unpack,
+)
 
 router = APIRouter()
 
@@ -20,12 +34,12 @@ def create_profile(
     project_id: int,
     sample_id: int,
     profile: ProfileCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -66,12 +80,12 @@ def create_profile(
 def get_profiles(
     project_id: int,
     sample_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -105,12 +119,12 @@ def get_profile(
     project_id: int,
     sample_id: int,
     profile_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -141,6 +155,54 @@ def get_profile(
     return profile
 
 
+# RESAMPLE Project Profiles on common grid
+@router.get("/resample/{project_id}", response_model=list[ResampledProfileSchema])
+def resample_profiles(
+    project_id: int,
+    options: Annotated[ResampleSchema, Query()],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    profiles = (
+        db.query(Profile)
+        .join(Sample)
+        .filter(Sample.project_id == project_id)
+        .filter(Profile.id.in_(options.ids))
+        .order_by(Profile.id)
+        .all()
+    )
+    if len(profiles) != len(set(options.ids)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    distance = options.grid == "distance"
+    series = [read_series(db, profile) for profile in profiles]
+    try:
+        grid = common_grid(series, options)
+        return [
+            dict(
+                id=profile.id,
+                label=profile.label,
+                columns=columns(
+                    resample(data, grid, distance, options), axis=options.grid
+                ),
+            )
+            for profile, data in zip(profiles, series)
+        ]
+    except SeriesError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+
 # UPDATE Sample Profile
 @router.put(
     "/profile/{project_id}/{sample_id}/{profile_id}",
@@ -151,12 +213,12 @@ def update_profile(
     sample_id: int,
     profile_id: int,
     profile_update: ProfileCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -192,6 +254,113 @@ def update_profile(
     return profile
 
 
+# PACK Sample Profile into arrays
+@router.put(
+    "/profile/{project_id}/{sample_id}/{profile_id}/pack",
+    response_model=ProfileSchema,
+)
+def pack_profile(
+    project_id: int,
+    sample_id: int,
+    profile_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    # locked until commit, profile spot writes wait and then see packed
+    profile = (
+        db.query(Profile)
+        .filter_by(sample_id=sample_id)
+        .filter_by(id=profile_id)
+        .with_for_update()
+        .first()
+    )
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    if profile.packed is True:
+        return profile
+    try:
+        pack(db, profile)
+    except SeriesError as error:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    db.commit()
+    db.refresh(profile)
+    return profile
+
+
+# UNPACK Sample Profile into rows
+@router.put(
+    "/profile/{project_id}/{sample_id}/{profile_id}/unpack",
+    response_model=ProfileSchema,
+)
+def unpack_profile(
+    project_id: int,
+    sample_id: int,
+    profile_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    profile = (
+        db.query(Profile)
+        .filter_by(sample_id=sample_id)
+        .filter_by(id=profile_id)
+        .with_for_update()
+        .first()
+    )
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    if profile.packed is False:
+        return profile
+    unpack(db, profile)
+    db.commit()
+    db.refresh(profile)
+    return profile
+
+
 # DELETE Sample Profile
 @router.delete(
     "/profile/{project_id}/{sample_id}/{profile_id}",
@@ -201,12 +370,12 @@ def delete_profile(
     project_id: int,
     sample_id: int,
     profile_id: int,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -1,13 +1,26 @@
 # controllers/customer_controller.py
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
-from petroapi.auth import get_current_user
-from petroapi.database import get_db
-from petroapi.models import Profile, ProfileSpot, Project, Sample, User
-from petroapi.schema import ProfileSpotCreateSchema, ProfileSpotSchema
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.bulk import (
+    BulkError,
+    delete_filtered,
+    scaled_values,
+    update_filtered,
+    update_items,
+)
+from petroapi.database import get_db, get_read_db
+from petroapi.models import Profile, ProfileSpot, Project, Sample
+from petroapi.schema import (
+    BulkDeleteSchema,
+    ProfileSpotBulkUpdateSchema,
+    ProfileSpotCreateSchema,
+    ProfileSpotSchema,
+)
+from petroapi.series import columns, downsampled, read_series
 
 router = APIRouter()
 
@@ -24,12 +37,12 @@ def create_profilespot(
     sample_id: int,
     profile_id: int,
     profilespot: ProfileSpotCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -51,12 +64,17 @@ def create_profilespot(
         db.query(Profile)
         .filter_by(sample_id=sample_id)
         .filter_by(id=profile_id)
+        .with_for_update()
         .first()
     )
     if profile is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
         )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
     if (
         db.query(ProfileSpot)
         .filter_by(profile_id=profile_id)
@@ -70,6 +88,7 @@ def create_profilespot(
     new_profilespot = ProfileSpot(**profilespot.dict())
     profile.spots.append(new_profilespot)
     db.add(profile)
+    profile.version = Profile.version + 1
     db.commit()
     db.refresh(new_profilespot)
     return new_profilespot
@@ -85,12 +104,12 @@ def create_profilespots(
     sample_id: int,
     profile_id: int,
     profilespots: list[ProfileSpotCreateSchema],
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -112,12 +131,17 @@ def create_profilespots(
         db.query(Profile)
         .filter_by(sample_id=sample_id)
         .filter_by(id=profile_id)
+        .with_for_update()
         .first()
     )
     if profile is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
         )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
     new_profilespots = []
     for profilespot in profilespots:
         if (
@@ -135,6 +159,7 @@ def create_profilespots(
         new_profilespots.append(new_profilespot)
 
     db.add(profile)
+    profile.version = Profile.version + 1
     db.commit()
     for new_profilespot in new_profilespots:
         db.refresh(new_profilespot)
@@ -150,12 +175,13 @@ def get_profilespots(
     project_id: int,
     sample_id: int,
     profile_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
+    max_points: Annotated[int | None, Query(ge=3)] = None,
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -183,11 +209,18 @@ def get_profilespots(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
         )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
     profilespots = (
         db.query(ProfileSpot)
         .filter_by(profile_id=profile_id)
         .order_by(ProfileSpot.index.asc())
     )
+    if max_points is not None:
+        index = downsampled(db, profile, max_points)["index"]
+        profilespots = profilespots.filter(ProfileSpot.index.in_(index))
     if profilespots is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Profile spots not found"
@@ -195,6 +228,54 @@ def get_profilespots(
     return profilespots
 
 
+# READ Sample Profile Spots as columns
+@router.get(
+    "/profilecolumns/{project_id}/{sample_id}/{profile_id}",
+    response_model=dict[str, list[int | float | None]],
+)
+def get_profilecolumns(
+    project_id: int,
+    sample_id: int,
+    profile_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
+    max_points: Annotated[int | None, Query(ge=3)] = None,
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    profile = (
+        db.query(Profile)
+        .filter_by(sample_id=sample_id)
+        .filter_by(id=profile_id)
+        .first()
+    )
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    if max_points is not None:
+        return downsampled(db, profile, max_points)
+    return columns(read_series(db, profile))
+
+
 # READ Single Sample Profile Spot
 @router.get(
     "/profilespot/{project_id}/{sample_id}/{profile_id}/{profilespot_id}",
@@ -205,12 +286,12 @@ def get_profilespot(
     sample_id: int,
     profile_id: int,
     profilespot_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -238,6 +319,10 @@ def get_profilespot(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
         )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
     profilespot = (
         db.query(ProfileSpot)
         .filter_by(profile_id=profile_id)
@@ -262,12 +347,12 @@ def update_profilespot(
     profile_id: int,
     profilespot_id: int,
     profilespot_update: ProfileSpotCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -289,12 +374,17 @@ def update_profilespot(
         db.query(Profile)
         .filter_by(sample_id=sample_id)
         .filter_by(id=profile_id)
+        .with_for_update()
         .first()
     )
     if profile is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
         )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
     profilespot = (
         db.query(ProfileSpot)
         .filter_by(profile_id=profile_id)
@@ -308,11 +398,90 @@ def update_profilespot(
     for field, value in profilespot_update.dict(exclude_unset=True).items():
         setattr(profilespot, field, value)
 
+    profile.version = Profile.version + 1
     db.commit()
     db.refresh(profilespot)
     return profilespot
 
 
+# UPDATE Sample Profile Spots
+@router.patch(
+    "/profilespots/{project_id}/{sample_id}/{profile_id}",
+    response_model=dict[str, int],
+)
+def update_profilespots(
+    project_id: int,
+    sample_id: int,
+    profile_id: int,
+    profilespots_update: ProfileSpotBulkUpdateSchema,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    profile = (
+        db.query(Profile)
+        .filter_by(sample_id=sample_id)
+        .filter_by(id=profile_id)
+        .with_for_update()
+        .first()
+    )
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
+    try:
+        updated = update_items(
+            db,
+            ProfileSpot,
+            ProfileSpot.profile_id,
+            profile_id,
+            [item.dict(exclude_unset=True) for item in profilespots_update.items],
+        )
+        if profilespots_update.filter is not None:
+            changes = {}
+            if profilespots_update.scale:
+                changes["values"] = scaled_values(
+                    ProfileSpot, profilespots_update.scale
+                )
+            updated += update_filtered(
+                db,
+                ProfileSpot,
+                ProfileSpot.profile_id,
+                profile_id,
+                profilespots_update.filter,
+                changes,
+            )
+    except BulkError as error:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    profile.version = Profile.version + 1
+    db.commit()
+    return dict(updated=updated)
+
+
 # DELETE Sample Profile
 @router.delete(
     "/profilespot/{project_id}/{sample_id}/{profile_id}/{profilespot_id}",
@@ -323,12 +492,12 @@ def delete_profilespot(
     sample_id: int,
     profile_id: int,
     profilespot_id: int,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -350,12 +519,17 @@ def delete_profilespot(
         db.query(Profile)
         .filter_by(sample_id=sample_id)
         .filter_by(id=profile_id)
+        .with_for_update()
         .first()
     )
     if profile is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
         )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
     profilespot = (
         db.query(ProfileSpot)
         .filter_by(profile_id=profile_id)
@@ -367,5 +541,72 @@ def delete_profilespot(
             status_code=status.HTTP_404_NOT_FOUND, detail="Profile spot not found"
         )
     db.delete(profilespot)
+    profile.version = Profile.version + 1
     db.commit()
     return dict(message="Profile spot deleted successfully")
+
+
+# DELETE Sample Profile Spots
+@router.delete(
+    "/profilespots/{project_id}/{sample_id}/{profile_id}",
+    response_model=dict[str, int],
+)
+def delete_profilespots(
+    project_id: int,
+    sample_id: int,
+    profile_id: int,
+    criteria: Annotated[BulkDeleteSchema, Query()],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    profile = (
+        db.query(Profile)
+        .filter_by(sample_id=sample_id)
+        .filter_by(id=profile_id)
+        .with_for_update()
+        .first()
+    )
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    if profile.packed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Profile is packed"
+        )
+    try:
+        deleted = delete_filtered(
+            db,
+            ProfileSpot,
+            ProfileSpot.profile_id,
+            profile_id,
+            criteria,
+            dry_run=criteria.dry_run,
+        )
+    except BulkError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    if criteria.dry_run:
+        return dict(matched=deleted)
+    profile.version = Profile.version + 1
+    db.commit()
+    return dict(deleted=deleted)
@@ -2,11 +2,13 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from petroapi.auth import get_current_user
-from petroapi.database import get_db
-from petroapi.models import Project, User
+from petroapi.auth import TokenUser, get_current_user, membership_changed
+from petroapi.database import get_db, get_read_db
+from petroapi.models import Project, Purge, User
+from petroapi.purge import submit as submit_purge
 from petroapi.schema import ProjectCreateSchema, ProjectSchema, UserNameSchema
 
 router = APIRouter()
@@ -18,12 +20,12 @@ router = APIRouter()
 @router.post("/project/", response_model=ProjectSchema)
 def create_project(
     project: ProjectCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     if (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(name=project.name)
         .first()
     ):
@@ -32,9 +34,12 @@ def create_project(
             detail="Project with same name already exists",
         )
 
-    new_project = Project(**project.model_dump(), users=[user])
+    owner = db.get(User, user.id)
+    new_project = Project(**project.model_dump(), users=[owner])
+    owner.membership_version += 1
     db.add(new_project)
     db.commit()
+    membership_changed(owner)
     db.refresh(new_project)
     return new_project
 
@@ -42,23 +47,23 @@ def create_project(
 # READ All Projects
 @router.get("/projects/", response_model=list[ProjectSchema])
 def get_projects(
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     # return user.projects
-    return db.query(Project).where(Project.users.any(id=user.id))
+    return db.query(Project).where(Project.id.in_(user.projects))
 
 
 # READ Single Project
 @router.get("/project/{project_id}", response_model=ProjectSchema)
 def get_project(
     project_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -74,12 +79,12 @@ def get_project(
 def update_project(
     project_id: int,
     project_update: ProjectCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -100,12 +105,12 @@ def update_project(
 def adduser_project(
     project_id: int,
     user_update: UserNameSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -125,8 +130,10 @@ def adduser_project(
         )
     if new_user not in project.users:
         project.users.append(new_user)
+        new_user.membership_version += 1
         db.add(project)
         db.commit()
+        membership_changed(new_user)
         db.refresh(project)
         return project
     else:
@@ -141,12 +148,12 @@ def adduser_project(
 def removeuser_project(
     project_id: int,
     user_update: UserNameSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -166,8 +173,10 @@ def removeuser_project(
         )
     if user_todel in project.users:
         project.users.remove(user_todel)
+        user_todel.membership_version += 1
         db.add(project)
         db.commit()
+        membership_changed(user_todel)
         db.refresh(project)
         return project
     else:
@@ -181,12 +190,13 @@ def removeuser_project(
 @router.delete("/project/{project_id}", response_model=dict[str, str])
 def delete_project(
     project_id: int,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
+    soft: bool = False,
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -194,6 +204,16 @@ def delete_project(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
         )
+    if soft:
+        # hide now, purge children in the background
+        project.deleted_at = func.now()
+        purge = Purge(
+            user_id=user.id, kind="project", target_id=project.id, status="queued"
+        )
+        db.add(purge)
+        db.commit()
+        submit_purge(purge.id)
+        return dict(message="Project scheduled for deletion", purge_id=str(purge.id))
     db.delete(project)
     db.commit()
     return dict(message="Project deleted successfully")
@@ -0,0 +1,38 @@
+# controllers/customer_controller.py
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_db
+from petroapi.models import Purge
+from petroapi.schema import PurgeSchema
+
+router = APIRouter()
+
+# ---------------------------------- PURGE
+
+
+# READ All Purges
+@router.get("/purges/", response_model=list[PurgeSchema])
+def get_purges(
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    return db.query(Purge).filter_by(user_id=user.id).order_by(Purge.id.desc())
+
+
+# READ Single Purge
+@router.get("/purge/{purge_id}", response_model=PurgeSchema)
+def get_purge(
+    purge_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    purge = db.query(Purge).filter_by(user_id=user.id).filter_by(id=purge_id).first()
+    if purge is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Purge not found"
+        )
+    return purge
@@ -2,11 +2,13 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from petroapi.auth import get_current_user
-from petroapi.database import get_db
-from petroapi.models import Project, Sample, User
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_db, get_read_db
+from petroapi.models import Project, Purge, Sample
+from petroapi.purge import submit as submit_purge
 from petroapi.schema import SampleCreateSchema, SampleSchema
 
 router = APIRouter()
@@ -19,12 +21,12 @@ router = APIRouter()
 def create_sample(
     project_id: int,
     sample: SampleCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -54,12 +56,12 @@ def create_sample(
 @router.get("/samples/{project_id}", response_model=list[SampleSchema])
 def get_samples(
     project_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -80,12 +82,12 @@ def get_samples(
 def get_sample(
     project_id: int,
     sample_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -112,12 +114,12 @@ def update_sample(
     project_id: int,
     sample_id: int,
     sample_update: SampleCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -148,12 +150,13 @@ def update_sample(
 def delete_sample(
     project_id: int,
     sample_id: int,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
+    soft: bool = False,
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -171,6 +174,16 @@ def delete_sample(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
         )
+    if soft:
+        # hide now, purge children in the background
+        sample.deleted_at = func.now()
+        purge = Purge(
+            user_id=user.id, kind="sample", target_id=sample.id, status="queued"
+        )
+        db.add(purge)
+        db.commit()
+        submit_purge(purge.id)
+        return dict(message="Sample scheduled for deletion", purge_id=str(purge.id))
     db.delete(sample)
     db.commit()
     return dict(message="Sample deleted successfully")
@@ -4,9 +4,9 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
-from petroapi.auth import get_current_user
-from petroapi.database import get_db
-from petroapi.models import Profile, Project, Sample, Spot, User
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_read_db
+from petroapi.models import Profile, Project, Sample, Spot
 from petroapi.schema import ProfileSchema, ProjectSchema, SampleSchema, SpotSchema
 
 router = APIRouter()
@@ -17,12 +17,12 @@ router = APIRouter()
 @router.get("/search/project/{project_name}", response_model=ProjectSchema)
 def get_project(
     project_name: str,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(name=project_name)
         .first()
     )
@@ -37,13 +37,13 @@ def get_project(
 def get_sample(
     pid: int,
     sample_name: str,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     sample = (
         db.query(Sample)
         .join(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter(Project.id == pid)
         .filter(Sample.name == sample_name)
         .first()
@@ -60,14 +60,14 @@ def get_spots(
     pid: int,
     sid: int,
     mineral: str,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     spots = (
         db.query(Spot)
         .join(Sample)
         .join(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter(Project.id == pid)
         .filter(Sample.id == sid)
         .filter(Spot.mineral == mineral)
@@ -85,14 +85,14 @@ def get_profile(
     pid: int,
     sid: int,
     label: str,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     profile = (
         db.query(Profile)
         .join(Sample)
         .join(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter(Project.id == pid)
         .filter(Sample.id == sid)
         .filter(Profile.label == label)
@@ -0,0 +1,90 @@
+# controllers/customer_controller.py
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from petroapi.auth import TokenUser, get_current_user, membership_changed
+from petroapi.database import get_db, get_read_db
+from petroapi.models import Project, User
+from petroapi.schema import ProjectSchema
+from petroapi.snapshot import (
+    SnapshotError,
+    export,
+    load,
+    restore,
+    source_project,
+)
+
+router = APIRouter()
+
+# ---------------------------------- SNAPSHOT
+
+
+# EXPORT Project Snapshot
+@router.get("/snapshot/{project_id}", response_class=StreamingResponse)
+def export_snapshot(
+    project_id: int,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    # primary or replica chosen for the request
+    bind = db.get_bind()
+    return StreamingResponse(
+        export(bind, project_id),
+        media_type="application/gzip",
+        headers={
+            "Content-Disposition": f'attachment; filename="project-{project_id}.tar.gz"'
+        },
+    )
+
+
+# IMPORT Project Snapshot
+@router.post("/snapshot/", response_model=ProjectSchema)
+def import_snapshot(
+    file: UploadFile,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+    name: str | None = None,
+):
+    cursor = db.connection().connection.cursor()
+    try:
+        load(cursor, file.file)
+        source_name, description = source_project(cursor)
+    except SnapshotError as error:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    name = name or source_name
+    if (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(name=name)
+        .first()
+    ):
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Project with same name already exists",
+        )
+
+    owner = db.get(User, user.id)
+    new_project = Project(name=name, description=description, users=[owner])
+    owner.membership_version += 1
+    db.add(new_project)
+    db.flush()
+    restore(cursor, new_project.id)
+    db.commit()
+    membership_changed(owner)
+    db.refresh(new_project)
+    return new_project
@@ -1,13 +1,25 @@
 # controllers/customer_controller.py
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
-from petroapi.auth import get_current_user
-from petroapi.database import get_db
-from petroapi.models import Project, Sample, Spot, User
-from petroapi.schema import SpotCreateSchema, SpotSchema
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.bulk import (
+    BulkError,
+    delete_filtered,
+    scaled_values,
+    update_filtered,
+    update_items,
+)
+from petroapi.database import get_db, get_read_db
+from petroapi.models import Project, Sample, Spot
+from petroapi.schema import (
+    BulkDeleteSchema,
+    SpotBulkUpdateSchema,
+    SpotCreateSchema,
+    SpotSchema,
+)
 
 router = APIRouter()
 
@@ -20,12 +32,12 @@ def create_spot(
     project_id: int,
     sample_id: int,
     spot: SpotCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -56,6 +68,7 @@ def create_spot(
     new_spot = Spot(**spot.dict())
     sample.spots.append(new_spot)
     db.add(sample)
+    sample.version = Sample.version + 1
     db.commit()
     db.refresh(new_spot)
     return new_spot
@@ -67,12 +80,12 @@ def create_spots(
     project_id: int,
     sample_id: int,
     spots: list[SpotCreateSchema],
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -107,6 +120,7 @@ def create_spots(
         new_spots.append(new_spot)
 
     db.add(sample)
+    sample.version = Sample.version + 1
     db.commit()
     for new_spot in new_spots:
         db.refresh(new_spot)
@@ -118,12 +132,12 @@ def create_spots(
 def get_spots(
     project_id: int,
     sample_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -155,12 +169,12 @@ def get_spot(
     project_id: int,
     sample_id: int,
     spot_id: int,
-    user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -193,12 +207,12 @@ def update_spot(
     sample_id: int,
     spot_id: int,
     spot_update: SpotCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -224,11 +238,66 @@ def update_spot(
     for field, value in spot_update.dict(exclude_unset=True).items():
         setattr(spot, field, value)
 
+    sample.version = Sample.version + 1
     db.commit()
     db.refresh(spot)
     return spot
 
 
+# UPDATE Sample Spots
+@router.patch("/spots/{project_id}/{sample_id}", response_model=dict[str, int])
+def update_spots(
+    project_id: int,
+    sample_id: int,
+    spots_update: SpotBulkUpdateSchema,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    try:
+        updated = update_items(
+            db,
+            Spot,
+            Spot.sample_id,
+            sample_id,
+            [item.dict(exclude_unset=True) for item in spots_update.items],
+        )
+        if spots_update.filter is not None:
+            changes = {}
+            if spots_update.mineral is not None:
+                changes["mineral"] = spots_update.mineral
+            if spots_update.scale:
+                changes["values"] = scaled_values(Spot, spots_update.scale)
+            updated += update_filtered(
+                db, Spot, Spot.sample_id, sample_id, spots_update.filter, changes
+            )
+    except BulkError as error:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    sample.version = Sample.version + 1
+    db.commit()
+    return dict(updated=updated)
+
+
 # DELETE Sample Spot
 @router.delete(
     "/spot/{project_id}/{sample_id}/{spot_id}", response_model=dict[str, str]
@@ -237,12 +306,12 @@ def delete_spot(
     project_id: int,
     sample_id: int,
     spot_id: int,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     project = (
         db.query(Project)
-        .where(Project.users.any(id=user.id))
+        .where(Project.id.in_(user.projects))
         .filter_by(id=project_id)
         .first()
     )
@@ -266,5 +335,48 @@ def delete_spot(
             status_code=status.HTTP_404_NOT_FOUND, detail="Spot not found"
         )
     db.delete(spot)
+    sample.version = Sample.version + 1
     db.commit()
     return dict(message="Spot deleted successfully")
+
+
+# DELETE Sample Spots
+@router.delete("/spots/{project_id}/{sample_id}", response_model=dict[str, int])
+def delete_spots(
+    project_id: int,
+    sample_id: int,
+    criteria: Annotated[BulkDeleteSchema, Query()],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    try:
+        deleted = delete_filtered(
+            db, Spot, Spot.sample_id, sample_id, criteria, dry_run=criteria.dry_run
+        )
+    except BulkError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    if criteria.dry_run:
+        return dict(matched=deleted)
+    sample.version = Sample.version + 1
+    db.commit()
+    return dict(deleted=deleted)
@@ -0,0 +1,111 @@
+# controllers/customer_controller.py
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import Float, case, func, select
+from sqlalchemy.orm import Session
+
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_read_db
+from petroapi.models import Project, Sample, Spot
+from petroapi.schema import AggregateQuerySchema, AggregateSchema
+
+router = APIRouter()
+
+AGGREGATES = {
+    "mean": func.avg,
+    "std": func.stddev_samp,
+    "min": func.min,
+    "max": func.max,
+}
+
+# ---------------------------------- STATISTICS
+
+
+def oxide_value(oxide: str):
+    # numeric oxide value or NULL, aggregates skip NULLs
+    return case(
+        (
+            func.jsonb_typeof(Spot.values.op("->")(oxide)) == "number",
+            Spot.values.op("->>")(oxide).cast(Float),
+        )
+    )
+
+
+# AGGREGATE Project Spots by sample and mineral
+@router.get("/aggregate/{project_id}", response_model=AggregateSchema)
+def aggregate_spots(
+    project_id: int,
+    query: Annotated[AggregateQuerySchema, Query()],
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_read_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    if any(not 0 <= p <= 1 for p in query.percentiles):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Percentiles must be between 0 and 1",
+        )
+    columns = []
+    for n, oxide in enumerate(query.oxides):
+        value = oxide_value(oxide)
+        for stat in query.stats:
+            columns.append(AGGREGATES[stat](value).label(f"{stat}_{n}"))
+        for m, p in enumerate(query.percentiles):
+            columns.append(
+                func.percentile_cont(p).within_group(value).label(f"p{m}_{n}")
+            )
+    statement = (
+        select(
+            Sample.id,
+            Sample.name,
+            Spot.mineral,
+            func.count().label("count"),
+            # number of groups, computed after grouping, for pagination
+            func.count().over().label("total"),
+            *columns,
+        )
+        .join(Sample, Spot.sample_id == Sample.id)
+        .where(Sample.project_id == project_id)
+        .group_by(Sample.id, Sample.name, Spot.mineral)
+        .order_by(Sample.name, Sample.id, Spot.mineral)
+        .limit(query.limit)
+        .offset(query.offset)
+    )
+    if query.mineral is not None:
+        statement = statement.where(Spot.mineral == query.mineral)
+    rows = db.execute(statement).mappings().all()
+    items = []
+    for row in rows:
+        stats = {}
+        for n, oxide in enumerate(query.oxides):
+            stats[oxide] = {stat: row[f"{stat}_{n}"] for stat in query.stats}
+            for m, p in enumerate(query.percentiles):
+                stats[oxide][f"p{p * 100:g}"] = row[f"p{m}_{n}"]
+        items.append(
+            dict(
+                sample_id=row["id"],
+                sample=row["name"],
+                mineral=row["mineral"],
+                count=row["count"],
+                stats=stats,
+            )
+        )
+    total = rows[0]["total"] if rows else 0
+    if not rows and query.offset:
+        # past the last page, the window count is not available
+        total = db.scalar(
+            select(func.count()).select_from(
+                statement.limit(None).offset(None).order_by(None).subquery()
+            )
+        )
+    return dict(total=total, items=items)
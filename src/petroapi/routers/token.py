@@ -4,8 +4,8 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from petroapi.models import User
-from petroapi.schema import Token
-from petroapi.auth import verify_password, create_access_token
+from petroapi.schema import RefreshTokenSchema, Token
+from petroapi.auth import verify_password, verify_token, create_user_tokens
 from petroapi.database import get_db
 
 router = APIRouter()
@@ -31,5 +31,30 @@ async def login_for_access_token(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username})
-    return Token(access_token=access_token, token_type="bearer")
+    access_token, refresh_token = create_user_tokens(user)
+    return Token(
+        access_token=access_token, refresh_token=refresh_token, token_type="bearer"
+    )
+
+
+@router.post("/token/refresh", response_model=Token)
+async def refresh_access_token(
+    form_data: RefreshTokenSchema,
+    db: Annotated[Session, Depends(get_db)],
+):
+    payload = verify_token(form_data.refresh_token, token_type="refresh")
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = db.get(User, payload["uid"])
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    access_token, refresh_token = create_user_tokens(user)
+    return Token(
+        access_token=access_token, refresh_token=refresh_token, token_type="bearer"
+    )
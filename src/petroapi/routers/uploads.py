@@ -0,0 +1,75 @@
+# controllers/customer_controller.py
+import os
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from petroapi.auth import TokenUser, get_current_user
+from petroapi.database import get_db
+from petroapi.models import Project, Sample, Spot
+from petroapi.upload import UploadError, read_spots
+
+router = APIRouter()
+
+UPLOAD_BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", 5000))
+
+# ---------------------------------- UPLOAD
+
+
+# UPLOAD Sample Spots from CSV/TSV/XLSX file
+@router.post("/upload/spots/{project_id}/{sample_id}", response_model=dict[str, int])
+def upload_spots(
+    project_id: int,
+    sample_id: int,
+    file: UploadFile,
+    user: Annotated[TokenUser, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+):
+    project = (
+        db.query(Project)
+        .where(Project.id.in_(user.projects))
+        .filter_by(id=project_id)
+        .first()
+    )
+    if project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
+        )
+    sample = (
+        db.query(Sample)
+        .filter_by(project_id=project_id)
+        .filter_by(id=sample_id)
+        .first()
+    )
+    if sample is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sample not found"
+        )
+    inserted = 0
+    try:
+        for batch in read_spots(file.file, file.filename or "", UPLOAD_BATCH_SIZE):
+            labels = [spot["label"] for spot in batch]
+            if len(set(labels)) != len(labels):
+                raise UploadError("Duplicate labels in uploaded file")
+            # earlier batches are already inserted, so this also catches
+            # duplicates across batches
+            existing = db.scalars(
+                select(Spot.label)
+                .where(Spot.sample_id == sample_id)
+                .where(Spot.label.in_(labels))
+                .limit(1)
+            ).first()
+            if existing is not None:
+                raise UploadError(f"Spot with label {existing} already exists")
+            db.execute(
+                insert(Spot), [dict(spot, sample_id=sample_id) for spot in batch]
+            )
+            inserted += len(batch)
+    except UploadError as error:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    sample.version = Sample.version + 1
+    db.commit()
+    return dict(inserted=inserted)
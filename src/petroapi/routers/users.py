@@ -4,7 +4,7 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
-from petroapi.auth import get_current_user, get_password_hash
+from petroapi.auth import TokenUser, get_current_user, get_password_hash
 from petroapi.database import get_db
 from petroapi.models import User
 from petroapi.schema import UserCreateSchema, UserSchema
@@ -18,7 +18,7 @@ router = APIRouter()
 @router.post("/user/", response_model=UserSchema)
 def create_user(
     new_user: UserCreateSchema,
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     if user.id == 1:
@@ -48,7 +48,7 @@ def create_user(
 # READ All Users
 @router.get("/users/", response_model=list[UserSchema])
 def get_users(
-    user: Annotated[User, Depends(get_current_user)],
+    user: Annotated[TokenUser, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
 ):
     if user.id == 1:
@@ -1,6 +1,7 @@
-from typing import Any
+from datetime import datetime
+from typing import Any, Literal
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 class UserCreateSchema(BaseModel):
@@ -37,9 +38,36 @@ class UserNameSchema(BaseModel):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str | None = None
     token_type: str
 
 
+class RefreshTokenSchema(BaseModel):
+    refresh_token: str
+
+
+class ApiKeyCreateSchema(BaseModel):
+    name: str
+
+    class Config:
+        from_attributes = True
+        json_schema_extra = {"example": {"name": "microprobe-uploader"}}
+
+
+class ApiKeySchema(BaseModel):
+    id: int
+    name: str
+    prefix: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ApiKeyCreatedSchema(ApiKeySchema):
+    key: str
+
+
 class ProjectCreateSchema(BaseModel):
     name: str
     description: str | None = None
@@ -165,6 +193,7 @@ class ProfileSchema(BaseModel):
     id: int
     label: str
     mineral: str | None = None
+    packed: bool = False
 
     class Config:
         from_attributes = True
@@ -201,3 +230,204 @@ class ProfileSpotSchema(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class BulkFilterSchema(BaseModel):
+    ids: list[int] | None = None
+    label: str | None = None
+    mineral: str | None = None
+    index_min: int | None = None
+    index_max: int | None = None
+    total_min: float | None = None
+    total_max: float | None = None
+
+
+class BulkDeleteSchema(BulkFilterSchema):
+    dry_run: bool = False
+
+
+class SpotBulkItemSchema(BaseModel):
+    id: int
+    label: str | None = None
+    mineral: str | None = None
+    values: dict[str, Any] | None = None
+
+
+class SpotBulkUpdateSchema(BaseModel):
+    items: list[SpotBulkItemSchema] = []
+    filter: BulkFilterSchema | None = None
+    mineral: str | None = None
+    scale: dict[str, float] | None = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [{"id": 1, "label": "pl-1a"}, {"id": 2, "mineral": "Kfs"}],
+                "filter": {"label": "grt-*"},
+                "mineral": "Grt",
+                "scale": {"FeO": 1.02},
+            }
+        }
+
+
+class AreaBulkItemSchema(BaseModel):
+    id: int
+    label: str | None = None
+    values: dict[str, Any] | None = None
+
+
+class AreaBulkUpdateSchema(BaseModel):
+    items: list[AreaBulkItemSchema] = []
+    filter: BulkFilterSchema | None = None
+    scale: dict[str, float] | None = None
+
+
+class ProfileSpotBulkItemSchema(BaseModel):
+    id: int
+    index: int | None = None
+    values: dict[str, Any] | None = None
+
+
+class ProfileSpotBulkUpdateSchema(BaseModel):
+    items: list[ProfileSpotBulkItemSchema] = []
+    filter: BulkFilterSchema | None = None
+    scale: dict[str, float] | None = None
+
+
+class ResampleSchema(BaseModel):
+    ids: list[int]
+    grid: Literal["index", "distance"] = "index"
+    step: float = Field(1.0, gt=0)
+    points: int = Field(100, ge=2, le=100000)
+    method: Literal["linear", "spline"] = "linear"
+    smooth: Literal["mean", "savgol"] | None = None
+    window: int = Field(5, ge=3)
+    order: int = Field(2, ge=0)
+
+
+class ResampledProfileSchema(BaseModel):
+    id: int
+    label: str
+    columns: dict[str, list[float | None]]
+
+
+class AggregateQuerySchema(BaseModel):
+    oxides: list[str] = Field(min_length=1, max_length=20)
+    stats: list[Literal["mean", "std", "min", "max"]] = ["mean", "std"]
+    percentiles: list[float] = Field([], max_length=10)
+    mineral: str | None = None
+    limit: int = Field(100, ge=1, le=1000)
+    offset: int = Field(0, ge=0)
+
+
+class AggregateRowSchema(BaseModel):
+    sample_id: int
+    sample: str
+    mineral: str | None = None
+    count: int
+    stats: dict[str, dict[str, float | None]]
+
+
+class AggregateSchema(BaseModel):
+    total: int
+    items: list[AggregateRowSchema]
+
+
+class ChangeSchema(BaseModel):
+    entity: str
+    id: int
+    action: Literal["upsert", "delete"]
+    revision: int
+    project_id: int
+    data: dict[str, Any] | None = None
+
+
+class ChangesSchema(BaseModel):
+    cursor: str
+    more: bool
+    changes: list[ChangeSchema]
+
+
+class BatchOperationSchema(BaseModel):
+    op: Literal["create", "update", "delete"]
+    entity: Literal["sample", "spot", "area", "profile", "profilespot"]
+    # id of an existing row or ref of a row created earlier in the batch
+    id: int | str | None = None
+    parent: int | str | None = None
+    ref: str | None = None
+    data: dict[str, Any] = {}
+
+
+class BatchSchema(BaseModel):
+    operations: list[BatchOperationSchema] = Field(min_length=1, max_length=10000)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "operations": [
+                    {
+                        "op": "create",
+                        "entity": "sample",
+                        "ref": "s",
+                        "data": {"name": "SX18", "description": "gneiss"},
+                    },
+                    {
+                        "op": "create",
+                        "entity": "profile",
+                        "parent": "s",
+                        "ref": "p",
+                        "data": {"label": "profile-1", "mineral": "Grt"},
+                    },
+                    {
+                        "op": "create",
+                        "entity": "profilespot",
+                        "parent": "p",
+                        "data": {"index": 0, "values": {"SiO2": 37.2}},
+                    },
+                ]
+            }
+        }
+
+
+class BatchResultSchema(BaseModel):
+    op: str
+    entity: str
+    id: int
+    ref: str | None = None
+    data: (
+        SampleSchema
+        | SpotSchema
+        | AreaSchema
+        | ProfileSchema
+        | ProfileSpotSchema
+        | None
+    ) = None
+
+
+class JobSchema(BaseModel):
+    id: int
+    project_id: int
+    kind: str
+    status: str
+    total: int
+    processed: int
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class PurgeSchema(BaseModel):
+    id: int
+    kind: str
+    target_id: int
+    status: str
+    deleted_rows: int
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
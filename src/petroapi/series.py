@@ -0,0 +1,261 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, select
+
+from petroapi.models import Profile, ProfileArray, ProfileSpot
+
+_ = load_dotenv()
+# number of downsampled profiles kept in memory
+DOWNSAMPLE_CACHE_SIZE = int(os.environ.get("DOWNSAMPLE_CACHE_SIZE", 256))
+
+# index, oxide names and one series of floats per oxide, NaN if missing
+Series = tuple[list[int], list[str], list[list[float]]]
+
+
+class SeriesError(ValueError):
+    pass
+
+
+def number(value: Any, strict: bool) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if strict and value is not None:
+        raise SeriesError(f"Non-numeric value {value!r} cannot be packed")
+    return math.nan
+
+
+def read_rows(db, profile_id: int, strict: bool = False) -> Series:
+    rows = db.execute(
+        select(ProfileSpot.index, ProfileSpot.values)
+        .where(ProfileSpot.profile_id == profile_id)
+        .order_by(ProfileSpot.index)
+    ).all()
+    oxides = list(dict.fromkeys(oxide for row in rows for oxide in row.values))
+    values = [
+        [number(row.values.get(oxide), strict) for row in rows] for oxide in oxides
+    ]
+    return [row.index for row in rows], oxides, values
+
+
+def read_series(db, profile: Profile) -> Series:
+    if not profile.packed:
+        return read_rows(db, profile.id)
+    arrays = db.get(ProfileArray, profile.id)
+    return arrays.index, arrays.oxides, arrays.values
+
+
+def columns(series: Series, axis: str = "index") -> dict[str, list]:
+    index, oxides, values = series
+    result: dict[str, list] = {axis: list(index)}
+    for oxide, data in zip(oxides, values):
+        result[oxide] = [None if math.isnan(v) else v for v in data]
+    return result
+
+
+def pack(db, profile: Profile):
+    # the profile row has to be locked, so no rows are added between reading
+    # and deleting them
+    index, oxides, values = read_rows(db, profile.id, strict=True)
+    db.add(
+        ProfileArray(profile_id=profile.id, index=index, oxides=oxides, values=values)
+    )
+    db.execute(delete(ProfileSpot).where(ProfileSpot.profile_id == profile.id))
+    profile.packed = True
+
+
+def unpack(db, profile: Profile):
+    index, oxides, values = read_series(db, profile)
+    if index:
+        db.execute(
+            insert(ProfileSpot),
+            [
+                dict(
+                    profile_id=profile.id,
+                    index=i,
+                    values={
+                        oxide: data[n]
+                        for oxide, data in zip(oxides, values)
+                        if not math.isnan(data[n])
+                    },
+                )
+                for n, i in enumerate(index)
+            ],
+        )
+    db.execute(delete(ProfileArray).where(ProfileArray.profile_id == profile.id))
+    profile.packed = False
+
+
+def lttb(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets over all oxides at once, y has one row
+    # per oxide. Oxides are scaled to 0-1 and the triangle areas summed, so
+    # one set of points preserves the shape of every series.
+    n = x.size
+    if n <= max_points:
+        return np.arange(n)
+    valid = ~np.isnan(y)
+    low = np.where(valid, y, np.inf).min(axis=1, keepdims=True)
+    high = np.where(valid, y, -np.inf).max(axis=1, keepdims=True)
+    span = high - low
+    y = (y - np.where(np.isfinite(low), low, 0)) / np.where(span > 0, span, 1)
+    # inner points split into max_points - 2 buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp)
+    lengths = np.diff(edges)
+    mean_x = np.add.reduceat(x[: n - 1], edges[:-1]) / lengths
+    counts = np.add.reduceat(valid[:, : n - 1], edges[:-1], axis=1)
+    sums = np.add.reduceat(np.where(valid, y, 0)[:, : n - 1], edges[:-1], axis=1)
+    mean_y = np.divide(sums, counts, out=np.full_like(sums, np.nan), where=counts > 0)
+    # average of the following bucket, the last point for the last bucket
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.hstack((mean_y[:, 1:], y[:, -1:]))
+    selected = np.empty(max_points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for b in range(max_points - 2):
+        start, end = edges[b], edges[b + 1]
+        area = np.abs(
+            (x[a] - next_x[b]) * (y[:, start:end] - y[:, a : a + 1])
+            - (x[a] - x[start:end]) * (next_y[:, b : b + 1] - y[:, a : a + 1])
+        )
+        a = start + int(np.argmax(np.nansum(area, axis=0)))
+        selected[b + 1] = a
+    return selected
+
+
+def downsample(series: Series, max_points: int) -> Series:
+    index, oxides, values = series
+    y = np.asarray(values, dtype=float).reshape(len(oxides), len(index))
+    selected = lttb(np.asarray(index, dtype=float), y, max_points)
+    return [index[i] for i in selected], oxides, y[:, selected].tolist()
+
+
+class SeriesCache:
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[tuple, dict[str, list]] = OrderedDict()
+
+    def get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: dict[str, list]):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+downsampled_cache = SeriesCache(DOWNSAMPLE_CACHE_SIZE)
+
+
+def downsampled(db, profile: Profile, max_points: int) -> dict[str, list]:
+    # the version changes with every write to the profile spots
+    key = (profile.id, profile.version, max_points)
+    result = downsampled_cache.get(key)
+    if result is None:
+        result = columns(downsample(read_series(db, profile), max_points))
+        downsampled_cache.put(key, result)
+    return result
+
+
+def tangents(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    # Fritsch-Carlson slopes, the interpolant does not overshoot the data,
+    # so concentrations never turn negative between points
+    h = np.diff(x)
+    delta = np.diff(y, axis=1) / h
+    d = np.empty_like(y)
+    d[:, 0], d[:, -1] = delta[:, 0], delta[:, -1]
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (w1 + w2) / (w1 / delta[:, :-1] + w2 / delta[:, 1:])
+    d[:, 1:-1] = np.where(delta[:, :-1] * delta[:, 1:] > 0, mean, 0)
+    return d
+
+
+def interpolate(x: np.ndarray, y: np.ndarray, grid: np.ndarray, method: str):
+    result = np.full((y.shape[0], grid.size), np.nan)
+    if x.size < 2:
+        return result
+    inside = (grid >= x[0]) & (grid <= x[-1])
+    g = grid[inside]
+    k = np.clip(np.searchsorted(x, g, side="right") - 1, 0, x.size - 2)
+    h = x[k + 1] - x[k]
+    t = (g - x[k]) / h
+    y0, y1 = y[:, k], y[:, k + 1]
+    if method == "linear":
+        result[:, inside] = y0 + (y1 - y0) * t
+    else:
+        d = tangents(x, y)
+        result[:, inside] = (
+            (1 + 2 * t) * (1 - t) ** 2 * y0
+            + t * (1 - t) ** 2 * h * d[:, k]
+            + t**2 * (3 - 2 * t) * y1
+            + t**2 * (t - 1) * h * d[:, k + 1]
+        )
+    return result
+
+
+def smooth(y: np.ndarray, method: str, window: int, order: int) -> np.ndarray:
+    if window % 2 == 0:
+        raise SeriesError("Smoothing window must be odd")
+    if y.shape[1] < window:
+        return y
+    half = window // 2
+    # repeat edge values, so the output has the grid size
+    padded = np.pad(y, ((0, 0), (half, half)), mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+    if method == "mean":
+        return windows.mean(axis=-1)
+    if order >= window:
+        raise SeriesError("Savitzky-Golay order must be smaller than window")
+    # least squares polynomial fit evaluated at the window centre
+    offsets = np.arange(-half, half + 1)
+    coefficients = np.linalg.pinv(np.vander(offsets, order + 1, increasing=True))[0]
+    return windows @ coefficients
+
+
+def common_grid(series: list[Series], options) -> np.ndarray:
+    if options.grid == "distance":
+        # position along the profile scaled to 0-1, profiles of different
+        # length become comparable
+        return np.linspace(0, 1, options.points)
+    ranges = [(index[0], index[-1]) for index, _, _ in series if index]
+    if not ranges:
+        return np.empty(0)
+    start = min(first for first, _ in ranges)
+    stop = max(last for _, last in ranges)
+    if (stop - start) / options.step > 100000:
+        raise SeriesError("Grid is too large, increase step")
+    return np.arange(start, stop + options.step / 2, options.step)
+
+
+def resample(series: Series, grid: np.ndarray, distance: bool, options) -> Series:
+    index, oxides, values = series
+    x = np.asarray(index, dtype=float)
+    y = np.asarray(values, dtype=float).reshape(len(oxides), len(index))
+    if distance and x.size > 1:
+        x = (x - x[0]) / (x[-1] - x[0])
+    # oxides missing at the same points are interpolated together, usually
+    # all oxides are complete and this is a single pass
+    valid = ~np.isnan(y)
+    masks, groups = np.unique(valid, axis=0, return_inverse=True)
+    groups = groups.ravel()
+    result = np.full((len(oxides), grid.size), np.nan)
+    for group, mask in enumerate(masks):
+        rows = groups == group
+        result[rows] = interpolate(x[mask], y[rows][:, mask], grid, options.method)
+    y = result
+    if options.smooth is not None:
+        y = smooth(y, options.smooth, options.window, options.order)
+    return grid.tolist(), oxides, y.tolist()
@@ -0,0 +1,212 @@
+import io
+import json
+import tarfile
+import tempfile
+import time
+import zlib
+from typing import IO, Iterator
+
+import psycopg2
+
+SNAPSHOT_FORMAT = 1
+CHUNK_SIZE = 1024 * 1024
+# table dumps up to this size stay in memory, larger ones go to disk
+SPOOL_SIZE = CHUNK_SIZE
+
+SAMPLES = (
+    "SELECT id FROM samples " "WHERE project_id = %(project_id)s AND deleted_at IS NULL"
+)
+PROFILES = f"SELECT id FROM profiles WHERE sample_id IN ({SAMPLES})"
+
+# table -> (columns, rows belonging to the project), parents before children
+TABLES = {
+    "projects": (
+        "id, name, description",
+        "FROM projects WHERE id = %(project_id)s",
+    ),
+    "samples": (
+        "id, name, description",
+        "FROM samples WHERE project_id = %(project_id)s AND deleted_at IS NULL",
+    ),
+    "spots": (
+        'id, sample_id, label, mineral, "values"',
+        f"FROM spots WHERE sample_id IN ({SAMPLES})",
+    ),
+    "areas": (
+        'id, sample_id, label, "values"',
+        f"FROM areas WHERE sample_id IN ({SAMPLES})",
+    ),
+    "profiles": (
+        "id, sample_id, label, mineral, packed",
+        f"FROM profiles WHERE sample_id IN ({SAMPLES})",
+    ),
+    "profilespots": (
+        'id, profile_id, "index", "values"',
+        f"FROM profilespots WHERE profile_id IN ({PROFILES})",
+    ),
+    "profilearrays": (
+        'profile_id, "index", oxides, "values"',
+        f"FROM profilearrays WHERE profile_id IN ({PROFILES})",
+    ),
+}
+
+# new ids are drawn from the sequences, children are joined to the id maps
+RESTORE = [
+    "CREATE TEMP TABLE snapshot_sample_ids ON COMMIT DROP AS "
+    "SELECT id AS old_id, "
+    "nextval(pg_get_serial_sequence('samples', 'id')) AS new_id "
+    "FROM snapshot_samples",
+    "CREATE TEMP TABLE snapshot_profile_ids ON COMMIT DROP AS "
+    "SELECT id AS old_id, "
+    "nextval(pg_get_serial_sequence('profiles', 'id')) AS new_id "
+    "FROM snapshot_profiles",
+    "INSERT INTO samples (id, project_id, name, description) "
+    "SELECT m.new_id, %(project_id)s, t.name, t.description "
+    "FROM snapshot_samples t JOIN snapshot_sample_ids m ON m.old_id = t.id",
+    'INSERT INTO spots (sample_id, label, mineral, "values") '
+    'SELECT m.new_id, t.label, t.mineral, t."values" '
+    "FROM snapshot_spots t JOIN snapshot_sample_ids m ON m.old_id = t.sample_id",
+    'INSERT INTO areas (sample_id, label, "values") '
+    'SELECT m.new_id, t.label, t."values" '
+    "FROM snapshot_areas t JOIN snapshot_sample_ids m ON m.old_id = t.sample_id",
+    "INSERT INTO profiles (id, sample_id, label, mineral, packed) "
+    "SELECT p.new_id, m.new_id, t.label, t.mineral, t.packed "
+    "FROM snapshot_profiles t JOIN snapshot_profile_ids p ON p.old_id = t.id "
+    "JOIN snapshot_sample_ids m ON m.old_id = t.sample_id",
+    'INSERT INTO profilespots (profile_id, "index", "values") '
+    'SELECT p.new_id, t."index", t."values" '
+    "FROM snapshot_profilespots t "
+    "JOIN snapshot_profile_ids p ON p.old_id = t.profile_id",
+    'INSERT INTO profilearrays (profile_id, "index", oxides, "values") '
+    'SELECT p.new_id, t."index", t.oxides, t."values" '
+    "FROM snapshot_profilearrays t "
+    "JOIN snapshot_profile_ids p ON p.old_id = t.profile_id",
+]
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def dump(cursor, table: str, project_id: int) -> tuple[IO[bytes], int]:
+    # binary COPY of one table, spooled since the tar header needs its size
+    columns, rows = TABLES[table]
+    data = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    query = cursor.mogrify(
+        f"COPY (SELECT {columns} {rows}) TO STDOUT WITH (FORMAT binary)",
+        dict(project_id=project_id),
+    ).decode()
+    cursor.copy_expert(query, data, size=CHUNK_SIZE)
+    return data, cursor.rowcount
+
+
+def manifest() -> bytes:
+    tables = {table: dict(columns=columns) for table, (columns, _) in TABLES.items()}
+    return json.dumps(
+        dict(format=SNAPSHOT_FORMAT, created=int(time.time()), tables=tables)
+    ).encode()
+
+
+def export(engine, project_id: int) -> Iterator[bytes]:
+    # all tables are dumped from the same database snapshot, on a connection
+    # of its own since the archive is sent after the request session closed
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="REPEATABLE READ")
+        yield from archive(conn.connection.cursor(), project_id)
+
+
+def archive(cursor, project_id: int) -> Iterator[bytes]:
+    # tar.gz written member by member, each table is dumped right before it
+    # is sent, so the response starts at once and at most one table is spooled
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    now = int(time.time())
+    yield from member(compressor, "manifest.json", io.BytesIO(manifest()), now)
+    for table in TABLES:
+        data, rows = dump(cursor, table, project_id)
+        try:
+            yield from member(
+                compressor, f"{table}.bin", data, now, {"PETROAPI.rows": str(rows)}
+            )
+        finally:
+            data.close()
+    yield from compressed(compressor, [b"\0" * 2 * tarfile.BLOCKSIZE])
+    yield compressor.flush()
+
+
+def member(compressor, name: str, data: IO[bytes], mtime: int, headers=None):
+    size = data.seek(0, io.SEEK_END)
+    data.seek(0)
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    info.pax_headers = headers or {}
+    parts = [info.tobuf(tarfile.PAX_FORMAT)]
+    while chunk := data.read(CHUNK_SIZE):
+        parts.append(chunk)
+        yield from compressed(compressor, parts)
+        parts = []
+    parts.append(b"\0" * (-size % tarfile.BLOCKSIZE))
+    yield from compressed(compressor, parts)
+
+
+def compressed(compressor, parts: list[bytes]) -> Iterator[bytes]:
+    for part in parts:
+        chunk = compressor.compress(part)
+        if chunk:
+            yield chunk
+
+
+def load(cursor, fileobj: IO[bytes]) -> dict:
+    # COPY every dump into a temporary table, straight from the stream
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|gz") as snapshot:
+            members = iter(snapshot)
+            first = next(members, None)
+            if first is None or first.name != "manifest.json":
+                raise SnapshotError("Missing snapshot manifest")
+            info = json.load(snapshot.extractfile(first))
+            if info.get("format") != SNAPSHOT_FORMAT:
+                raise SnapshotError("Unsupported snapshot format")
+            for table, (columns, _) in TABLES.items():
+                if info.get("tables", {}).get(table, {}).get("columns") != columns:
+                    raise SnapshotError(f"Unsupported columns of table {table}")
+            loaded = set()
+            for member in members:
+                table = member.name.removesuffix(".bin")
+                if table not in TABLES or table in loaded:
+                    raise SnapshotError(f"Unexpected snapshot member {member.name}")
+                columns = TABLES[table][0]
+                cursor.execute(
+                    f"CREATE TEMP TABLE snapshot_{table} ON COMMIT DROP AS "
+                    f"SELECT {columns} FROM {table} WITH NO DATA"
+                )
+                cursor.copy_expert(
+                    f"COPY snapshot_{table} FROM STDIN WITH (FORMAT binary)",
+                    snapshot.extractfile(member),
+                    size=CHUNK_SIZE,
+                )
+                loaded.add(table)
+    except (
+        tarfile.TarError,
+        EOFError,
+        OSError,
+        json.JSONDecodeError,
+        psycopg2.DataError,
+    ) as error:
+        raise SnapshotError(f"Invalid snapshot: {error}")
+    if loaded != set(TABLES):
+        raise SnapshotError("Incomplete snapshot")
+    return info
+
+
+def source_project(cursor) -> tuple[str, str | None]:
+    cursor.execute("SELECT name, description FROM snapshot_projects")
+    rows = cursor.fetchall()
+    if len(rows) != 1:
+        raise SnapshotError("Snapshot must contain one project")
+    return rows[0]
+
+
+def restore(cursor, project_id: int):
+    for statement in RESTORE:
+        cursor.execute(statement, dict(project_id=project_id))
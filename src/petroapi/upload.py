@@ -0,0 +1,127 @@
+import codecs
+import csv
+import itertools
+import re
+from typing import Any, BinaryIO, Iterator
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+LABEL_COLUMNS = {"label", "name", "spot", "point", "comment"}
+MINERAL_COLUMNS = {"mineral", "phase", "min"}
+# summary columns are not stored as values
+SKIP_COLUMNS = {"total", "totals", "sum"}
+# length of the label columns in the database
+LABEL_MAX_LENGTH = 32
+
+_units = re.compile(r"\s*[\(\[].*?[\)\]]\s*|\s*wt\s*%\s*|\s*%\s*", re.IGNORECASE)
+
+
+class UploadError(ValueError):
+    pass
+
+
+def column_key(header: str) -> str:
+    # "SiO2 (wt%)", "SiO2 [wt.%]" or "SiO2 wt%" -> "SiO2"
+    return _units.sub("", str(header)).strip()
+
+
+class ColumnMap:
+    def __init__(self, header: list[Any]):
+        self.label = None
+        self.mineral = None
+        self.values: list[tuple[int, str]] = []
+        for i, name in enumerate(header):
+            if name is None or str(name).strip() == "":
+                continue
+            key = column_key(name)
+            lower = key.lower()
+            if lower in LABEL_COLUMNS and self.label is None:
+                self.label = i
+            elif lower in MINERAL_COLUMNS and self.mineral is None:
+                self.mineral = i
+            elif lower not in SKIP_COLUMNS:
+                self.values.append((i, key))
+        if self.label is None:
+            raise UploadError("Missing label column")
+        if not self.values:
+            raise UploadError("No oxide columns found")
+
+    def spot(self, row: list[Any], line: int) -> dict[str, Any]:
+        label = row[self.label] if self.label < len(row) else None
+        if label is None or str(label).strip() == "":
+            raise UploadError(f"Missing label on row {line}")
+        label = str(label).strip()
+        if len(label) > LABEL_MAX_LENGTH:
+            raise UploadError(
+                f"Label longer than {LABEL_MAX_LENGTH} characters on row {line}"
+            )
+        values = {}
+        for i, key in self.values:
+            if i >= len(row) or row[i] is None or str(row[i]).strip() == "":
+                continue
+            try:
+                values[key] = float(str(row[i]).replace(",", "."))
+            except ValueError:
+                raise UploadError(f"Invalid value of {key} on row {line}")
+        mineral = None
+        if self.mineral is not None and self.mineral < len(row):
+            mineral = str(row[self.mineral]).strip() or None
+        return dict(label=label, mineral=mineral, values=values)
+
+
+def text_rows(file: BinaryIO) -> Iterator[list[str]]:
+    # decode incrementally, the file is never read into memory as a whole
+    lines = codecs.iterdecode(iter(lambda: file.readline(), b""), "utf-8-sig")
+    lines = (line for line in lines if line.strip())
+    header = next(lines, None)
+    if header is None:
+        return
+    if "\t" in header:
+        delimiter = "\t"
+    elif ";" in header and "," not in header:
+        delimiter = ";"
+    else:
+        delimiter = ","
+    yield from csv.reader(itertools.chain([header], lines), delimiter=delimiter)
+
+
+def xlsx_rows(file: BinaryIO) -> Iterator[list[Any]]:
+    if openpyxl is None:
+        raise UploadError("XLSX upload requires the openpyxl package")
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except Exception:
+        raise UploadError("Invalid XLSX file")
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            if any(cell is not None for cell in row):
+                yield list(row)
+    finally:
+        workbook.close()
+
+
+def read_spots(
+    file: BinaryIO, filename: str, batch_size: int
+) -> Iterator[list[dict[str, Any]]]:
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        rows = xlsx_rows(file)
+    else:
+        rows = text_rows(file)
+    try:
+        header = next(rows, None)
+        if header is None:
+            raise UploadError("Empty file")
+        columns = ColumnMap(header)
+        batch = []
+        for line, row in enumerate(rows, start=2):
+            batch.append(columns.spot(row, line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    except (csv.Error, UnicodeDecodeError) as error:
+        raise UploadError(f"Invalid file: {error}")